@@ -0,0 +1,156 @@
+from array import array
+from collections import defaultdict
+
+from paragraph_state import ParagraphState
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Per character and per bigram latency and error rate tables.
+#
+# Everything works over keystroke samples: parallel sequences of timestamps,
+# expected characters (as code points) and char states (as ASCII codes), like
+# the records in the keystroke log. Only correct keystrokes right after another
+# correct one count for latency, so time spent fixing errors doesn't show up
+# as slowness. Samples in any other state (backspaces, paragraph starts...)
+# break those chains.
+
+CORRECT = ord(ParagraphState.CHAR_CORRECT)
+WRONG = ord(ParagraphState.CHAR_WRONG)
+
+# Longer pauses are not typing, but thinking or resting
+MAX_LATENCY_S = 2
+
+
+# Accumulates samples from several paragraphs (or whole sessions)
+class KeystrokeSamples:
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.expected = array('I')
+        self.states = bytearray()
+
+
+    def __len__(self):
+        return len(self.states)
+
+
+    # Only the last keystroke of each character is known: the characters with
+    # errors are taken as wrong (that's what they were when first typed), and
+    # the ones never typed are left out
+    def add_paragraph(self, state):
+        touched = state.chars_touched
+        char_states = state.char_state_map[:touched].replace(ParagraphState.CHAR_AMENDED.encode(), ParagraphState.CHAR_WRONG.encode())
+        self._break_chain()
+        self.timestamps.extend(state.char_times[:touched])
+        self.expected.extend(array('I', state.exercise_txt[:touched].encode('utf-32-le')))
+        self.states += char_states
+
+
+    def add_records(self, records):
+        self._break_chain()
+        for timestamp, expected, _, char_state in records:
+            self.timestamps.append(timestamp)
+            self.expected.append(expected)
+            self.states.append(char_state)
+
+
+    def _break_chain(self):
+        self.timestamps.append(0)
+        self.expected.append(0)
+        self.states.append(ord(ParagraphState.CHAR_PENDING))
+
+
+# Returns {'chars': {char: row}, 'bigrams': {bigram: row}}, each row being a
+# dict with the number of `attempts`, the `error_rate`, the number of latency
+# `samples` and the `mean_latency_s` (None if no samples)
+def latency_tables(samples):
+    if numpy is not None:
+        return _latency_tables_numpy(samples)
+    return _latency_tables_python(samples)
+
+
+def slowest_bigrams(tables, count=5, min_samples=3):
+    bigrams = [(bigram, row) for bigram, row in tables['bigrams'].items() if row['samples'] >= min_samples]
+    bigrams.sort(key=lambda item: item[1]['mean_latency_s'], reverse=True)
+    return bigrams[:count]
+
+
+def _latency_tables_numpy(samples):
+    timestamps = numpy.frombuffer(samples.timestamps, dtype=numpy.float64)
+    expected = numpy.frombuffer(samples.expected, dtype=numpy.uint32).astype(numpy.uint64)
+    states = numpy.frombuffer(bytes(samples.states), dtype=numpy.uint8)
+
+    attempted = (states == CORRECT) | (states == WRONG)
+    wrong = states == WRONG
+    latencies = timestamps[1:] - timestamps[:-1]
+    timed = (states[1:] == CORRECT) & (states[:-1] == CORRECT) & (latencies > 0) & (latencies <= MAX_LATENCY_S)
+    bigram_attempted = attempted[1:] & attempted[:-1]
+    bigram_keys = (expected[:-1] << 32) | expected[1:]
+
+    def table(keys, attempted, wrong, timed_keys, timed_latencies):
+        attempt_keys, attempt_counts = numpy.unique(keys[attempted], return_counts=True)
+        error_keys, error_counts = numpy.unique(keys[attempted & wrong], return_counts=True)
+        latency_keys, latency_idx = numpy.unique(timed_keys, return_inverse=True)
+        latency_sums = numpy.bincount(latency_idx, weights=timed_latencies, minlength=len(latency_keys))
+        latency_counts = numpy.bincount(latency_idx, minlength=len(latency_keys))
+
+        rows = {key: _row(attempts) for key, attempts in zip(attempt_keys.tolist(), attempt_counts.tolist())}
+        for key, errors in zip(error_keys.tolist(), error_counts.tolist()):
+            rows[key]['error_rate'] = errors / rows[key]['attempts']
+        for key, total, count in zip(latency_keys.tolist(), latency_sums.tolist(), latency_counts.tolist()):
+            rows.setdefault(key, _row(0)).update(samples=count, mean_latency_s=total / count)
+        return rows
+
+    chars = table(expected, attempted, wrong, expected[1:][timed], latencies[timed])
+    bigrams = table(bigram_keys, bigram_attempted, wrong[1:], bigram_keys[timed], latencies[timed])
+
+    return {
+        'chars': {chr(key): row for key, row in chars.items()},
+        'bigrams': {chr(key >> 32) + chr(key & 0xFFFFFFFF): row for key, row in bigrams.items()},
+    }
+
+
+def _latency_tables_python(samples):
+    chars = defaultdict(lambda: _row(0))
+    bigrams = defaultdict(lambda: _row(0))
+    latency_sums = defaultdict(float)
+
+    previous = None
+    for timestamp, expected, state in zip(samples.timestamps, samples.expected, samples.states):
+        char = chr(expected)
+        attempted = state in (CORRECT, WRONG)
+        if attempted:
+            chars[char]['attempts'] += 1
+            chars[char]['error_rate'] += state == WRONG
+
+        if previous is not None:
+            previous_timestamp, previous_char, previous_state = previous
+            bigram = previous_char + char
+            if attempted and previous_state in (CORRECT, WRONG):
+                bigrams[bigram]['attempts'] += 1
+                bigrams[bigram]['error_rate'] += state == WRONG
+
+            latency = timestamp - previous_timestamp
+            if state == CORRECT and previous_state == CORRECT and 0 < latency <= MAX_LATENCY_S:
+                for key, rows in ((char, chars), (bigram, bigrams)):
+                    rows[key]['samples'] += 1
+                    latency_sums[rows is bigrams, key] += latency
+
+        previous = (timestamp, char, state)
+
+    # Counts to rates and means
+    for is_bigram, rows in ((False, chars), (True, bigrams)):
+        for key, row in rows.items():
+            row['error_rate'] = row['error_rate'] / row['attempts'] if row['attempts'] else 0
+            if row['samples']:
+                row['mean_latency_s'] = latency_sums[is_bigram, key] / row['samples']
+
+    return {'chars': dict(chars), 'bigrams': dict(bigrams)}
+
+
+def _row(attempts):
+    return {'attempts': attempts, 'error_rate': 0, 'samples': 0, 'mean_latency_s': None}
@@ -0,0 +1,68 @@
+# Per-keystroke processing time of the exercise loop, replaying synthetic
+# keystroke streams (with typos and backspace bursts) headlessly through the
+# real `run_paragraph_exercise`. Reports percentiles per plugin and paragraph
+# length, to catch regressions in the input path.
+#
+#   python benchmarks/bench_keystroke_latency.py
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from headless import replay, synthetic_keystrokes
+from plugins.file import File
+from plugins.serials import Serials
+from plugins.song import Song
+
+
+LENGTHS = [100, 1_000, 10_000, 100_000]
+# Long paragraphs are only typed this far, which is enough for percentiles
+MAX_KEYSTROKES = 5_000
+
+
+def random_prose(length, rng):
+    words, total = [], 0
+    while total < length:
+        words.append(''.join(rng.choices('etaoinshrdlucmfwypvbgkjqxz', k=rng.randint(1, 10))))
+        total += len(words[-1]) + 1
+    return ' '.join(words)[:length].strip()
+
+
+# A paragraph of (about) the given length from each plugin
+def paragraphs(length, rng, tmp_dir):
+    serials = Serials(argparse.Namespace(num=max(1, length // 10), chars=9, words_file=None))
+    yield 'serials', serials.generate_paragraphs(1)[0]
+
+    path = os.path.join(tmp_dir, f'prose-{length}.txt')
+    with open(path, 'w') as f:
+        f.write(random_prose(length, rng))
+    yield 'file', next(File(argparse.Namespace(path=path, whole=True, cache=False)).paragraph_generator())
+
+    path = os.path.join(tmp_dir, f'song-{length}.txt')
+    with open(path, 'w') as f:
+        prose = random_prose(length, rng)
+        f.write('\n'.join(prose[i:i + 40].strip() for i in range(0, len(prose), 40)))
+    yield 'song', next(Song(argparse.Namespace(path=path, cache=False)).paragraph_generator())
+
+
+def main():
+    rng = random.Random(0)
+    print(f'{"plugin":<8} {"chars":>8} {"keys":>6} {"p50 us":>8} {"p99 us":>8} {"max us":>8}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for length in LENGTHS:
+            for plugin_name, paragraph in paragraphs(length, rng, tmp_dir):
+                paragraph = paragraph.strip()
+                keys = synthetic_keystrokes(paragraph, rng=rng)[:MAX_KEYSTROKES]
+                _, win = replay(paragraph, keys)
+                times_us = [t * 1_000_000 for t in win.key_processing_times]
+                percentiles = statistics.quantiles(times_us, n=100)
+                print(f'{plugin_name:<8} {len(paragraph):>8} {len(times_us):>6} {percentiles[49]:>8.1f} {percentiles[98]:>8.1f} {max(times_us):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
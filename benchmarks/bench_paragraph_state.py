@@ -0,0 +1,46 @@
+# Micro-benchmark for the per-keystroke cost of ParagraphState. Simulates the
+# exercise loop (a `register_char` followed by a `stats()` call per keypress)
+# over exercises of increasing length. Cost per keystroke should stay flat.
+#
+#   python benchmarks/bench_paragraph_state.py
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from paragraph_state import ParagraphState
+
+
+LENGTHS = [100, 1_000, 10_000, 100_000]
+KEYSTROKES = 2_000
+ERROR_RATE = 0.05
+
+
+def run(length):
+    exercise_txt = ''.join(random.choices(string.ascii_lowercase + ' ', k=length))
+    state = ParagraphState(exercise_txt)
+
+    keystrokes = min(KEYSTROKES, length - 1)
+    start = time.perf_counter()
+    for i in range(keystrokes):
+        expected = exercise_txt[i]
+        state.register_char(expected if random.random() > ERROR_RATE else '#')
+        state.stats()
+    elapsed = time.perf_counter() - start
+
+    return elapsed * 1_000_000 / keystrokes
+
+
+def main():
+    random.seed(0)
+    print(f'{"chars":>10}  {"us/keystroke":>12}')
+    for length in LENGTHS:
+        print(f'{length:>10}  {run(length):>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Throughput benchmark for serial number generation: the batched generator in
+# the serials plugin against the previous one-character-at-a-time version.
+#
+#   python benchmarks/bench_serials.py
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from plugins import serials
+from plugins.serials import Serials
+
+
+COUNT = 200_000
+NUM_CHARS = 9
+
+
+# Previous implementation, kept here as the baseline
+def legacy_generate_serial_number(num_chars):
+    serial_number = ''
+    for i in range(num_chars):
+        if i == int(num_chars / 2):
+            serial_number += '-'
+            continue
+        r = random.randint(0, 9)
+        if r < 2:
+            serial_number += random.choice(string.ascii_uppercase + '.')
+        else:
+            serial_number += str(random.randint(0, 9))
+    return serial_number
+
+
+def measure(generate):
+    start = time.perf_counter()
+    generate()
+    elapsed = time.perf_counter() - start
+    return COUNT / elapsed
+
+
+def main():
+    results = {
+        'legacy': measure(lambda: [legacy_generate_serial_number(NUM_CHARS) for _ in range(COUNT)]),
+    }
+
+    numpy = serials.numpy
+    serials.numpy = None
+    results['batched'] = measure(lambda: Serials.generate_serials(COUNT, NUM_CHARS))
+    serials.numpy = numpy
+    if numpy is not None:
+        results['batched (numpy)'] = measure(lambda: Serials.generate_serials(COUNT, NUM_CHARS))
+
+    plugin = Serials(argparse.Namespace(num=6, chars=NUM_CHARS, words_file=None))
+    results['paragraphs (x6)'] = measure(lambda: plugin.generate_paragraphs(COUNT // 6))
+
+    print(f'{"implementation":<18}  {"serials/s":>12}  {"speedup":>8}')
+    for name, throughput in results.items():
+        print(f'{name:<18}  {throughput:>12,.0f}  {throughput / results["legacy"]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
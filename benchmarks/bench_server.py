@@ -0,0 +1,108 @@
+# Key-echo latency and cost per session of the training server, with many
+# concurrent clients typing at a steady pace over a Unix socket. The server
+# runs in its own process (`main.py --serve`), so its CPU time and memory can
+# be told apart from the clients'. On machines with few cores the clients
+# compete with it for CPU, so latencies are an upper bound.
+#
+#   python benchmarks/bench_server.py
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+from protocol import encode_message, open_connection, read_message
+
+
+SESSIONS = [10, 100, 200]
+KEYS_PER_SESSION = 100
+
+# About 100 WPM
+KEY_INTERVAL_S = 0.12
+
+
+async def typist(address, latencies, connected, start):
+    reader, writer = await open_connection(address)
+    await read_message(reader)
+    writer.write(encode_message('hello', checkpoint=None))
+    connected.release()
+    await start.wait()
+
+    keys_sent = 0
+    while keys_sent < KEYS_PER_SESSION:
+        message = await read_message(reader)
+        if message['type'] != 'paragraph':
+            continue
+        for char in message['text']:
+            sent_at = time.perf_counter()
+            writer.write(encode_message('key', key=char))
+            while (await read_message(reader))['type'] != 'char':
+                pass
+            latencies.append(time.perf_counter() - sent_at)
+            keys_sent += 1
+            await asyncio.sleep(KEY_INTERVAL_S)
+        while (await read_message(reader))['type'] != 'done':
+            pass
+        writer.write(encode_message('next'))
+    writer.close()
+
+
+def server_cpu_s(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def server_rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+
+async def run(sessions, address, server_pid):
+    latencies = []
+    connected = asyncio.Semaphore(0)
+    start = asyncio.Event()
+    rss_before = server_rss_kib(server_pid)
+    typists = [asyncio.get_running_loop().create_task(typist(address, latencies, connected, start)) for _ in range(sessions)]
+    for _ in range(sessions):
+        await connected.acquire()
+    await asyncio.sleep(0.5)
+    rss_per_session = (server_rss_kib(server_pid) - rss_before) / sessions
+
+    cpu_before = server_cpu_s(server_pid)
+    start.set()
+    await asyncio.gather(*typists)
+    cpu_per_key = (server_cpu_s(server_pid) - cpu_before) / len(latencies)
+
+    latencies_us = [latency * 1_000_000 for latency in latencies]
+    percentiles = statistics.quantiles(latencies_us, n=100)
+    return percentiles[49], percentiles[98], cpu_per_key * 1_000_000, rss_per_session
+
+
+def main():
+    print(f'{"sessions":>8} {"p50 us":>8} {"p99 us":>8} {"server cpu us/key":>18} {"server KiB/session":>19}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        address = os.path.join(tmp_dir, 'server.sock')
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'main.py'), '--serve', address, 'serials', '--num', '10'],
+            env=dict(os.environ, TYPETRAIN_HOME=tmp_dir), stdout=subprocess.DEVNULL,
+        )
+        try:
+            while not os.path.exists(address):
+                time.sleep(0.05)
+            for sessions in SESSIONS:
+                p50, p99, cpu_per_key_us, rss_per_session = asyncio.run(run(sessions, address, server.pid))
+                print(f'{sessions:>8} {p50:>8.0f} {p99:>8.0f} {cpu_per_key_us:>18.0f} {rss_per_session:>19.1f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
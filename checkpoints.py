@@ -0,0 +1,29 @@
+import json
+
+from storage import atomic_write, storage_path
+
+
+# Resume checkpoints for each exercise source, as {resume_key: checkpoint}. See
+# `paragraphs_with_checkpoints` in the plugins package for what's stored
+CHECKPOINTS_FILE = 'checkpoints.json'
+
+
+def _load_all():
+    try:
+        with open(storage_path(CHECKPOINTS_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_checkpoint(resume_key):
+    return _load_all().get(resume_key)
+
+
+def save_checkpoint(resume_key, checkpoint):
+    checkpoints = _load_all()
+    checkpoints[resume_key] = checkpoint
+
+    # Written atomically, so an interrupted write doesn't lose all checkpoints
+    with atomic_write(storage_path(CHECKPOINTS_FILE)) as f:
+        json.dump(checkpoints, f, indent=2)
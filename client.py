@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import curses
+
+from checkpoints import load_checkpoint, save_checkpoint
+from layout import TextLayout, Viewport
+from main import (
+    TEXT_RIGHT_MARGIN, TEXT_TOP, display_char, draw_exercise_stats, draw_summary, init_colors_by_state, move_to_char, read_key,
+    redraw_exercise, resize_exercise, run_interruptible, update_stats_heading, wait_for_enter,
+)
+from paragraph_state import ParagraphState
+from protocol import encode_message, open_connection, read_message
+from renderer import Renderer
+from stats_aggregator import StatsAggregator
+from stats_text import render_aggregate_stats_as_list
+
+
+# Terminal client for a training server (`main.py --serve`). Keys are sent to
+# the server, which keeps the state of the exercise, and the screen is updated
+# with what it echoes back, drawn as in the standalone app.
+
+
+# Mirror of the server's state for the paragraph, with what's needed to draw it
+class RemoteParagraphState:
+
+    def __init__(self, exercise_txt):
+        self.exercise_txt = exercise_txt
+        self.char_state_map = bytearray(ParagraphState.CHAR_PENDING * len(exercise_txt), 'ascii')
+        self.current_char_idx = 0
+
+
+    def char_state(self, idx):
+        return chr(self.char_state_map[idx])
+
+
+async def run_remote_exercise(renderer, reader, writer, exercise_txt):
+    win = renderer.win
+    COLORS_BY_STATE = init_colors_by_state()
+
+    max_y, max_x = win.getmaxyx()
+    layout = TextLayout(exercise_txt, max_x - TEXT_RIGHT_MARGIN)
+    state = RemoteParagraphState(exercise_txt)
+    viewport = Viewport(layout, max_y - TEXT_TOP)
+    stats = ParagraphState(exercise_txt).stats()
+
+    # Keys go to the server as they come, without waiting for the echoes
+    async def send_keys():
+        while True:
+            key = await read_key(win)
+            if key == curses.KEY_RESIZE:
+                resize_exercise(win, viewport)
+                redraw_exercise(renderer, viewport, state, COLORS_BY_STATE, stats)
+            elif key in ('\x7f', '\x08') or (type(key) == str and key.isprintable()) or key == '\n':
+                writer.write(encode_message('key', key=key))
+
+    redraw_exercise(renderer, viewport, state, COLORS_BY_STATE, stats)
+    keys = asyncio.get_running_loop().create_task(send_keys())
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                raise ConnectionError('The server closed the connection')
+
+            if message['type'] == 'char':
+                idx, char_state = message['idx'], message['state']
+                state.char_state_map[idx] = ord(char_state)
+                state.current_char_idx = idx + 1
+                y, x = move_to_char(renderer, viewport, state, COLORS_BY_STATE, idx)
+                renderer.put(y, x, display_char(exercise_txt[idx], char_state), COLORS_BY_STATE[char_state])
+                move_to_char(renderer, viewport, state, COLORS_BY_STATE, state.current_char_idx)
+            elif message['type'] == 'backspace':
+                state.current_char_idx = message['idx']
+                y, x = move_to_char(renderer, viewport, state, COLORS_BY_STATE, state.current_char_idx)
+                renderer.put(y, x, display_char(exercise_txt[state.current_char_idx]), COLORS_BY_STATE[ParagraphState.CHAR_PENDING])
+            elif message['type'] in ('stats', 'done'):
+                stats = message['stats']
+                update_stats_heading(renderer, stats, force=True)
+            elif message['type'] == 'error':
+                raise ConnectionError(message['message'])
+
+            renderer.flush()
+            if message['type'] == 'done':
+                break
+    finally:
+        keys.cancel()
+
+    draw_exercise_stats(win, viewport, stats)
+    return stats
+
+
+async def client_app(win, address, resume):
+    aggregator = StatsAggregator()
+    renderer = Renderer(win)
+    win.nodelay(True)
+
+    reader, writer = await open_connection(address)
+    welcome = await read_message(reader)
+    if welcome is None or welcome['type'] != 'welcome':
+        raise ConnectionError('Unexpected answer from the server')
+
+    # Sources that can be resumed keep a checkpoint after the last paragraph
+    # written, as in the standalone app
+    resume_key = f'{address}|{welcome["resume_key"]}' if welcome['resume_key'] else None
+    checkpoint = load_checkpoint(resume_key) if resume and resume_key else None
+    writer.write(encode_message('hello', checkpoint=checkpoint))
+
+    async def run_exercises():
+        nonlocal checkpoint
+        while (message := await read_message(reader)) and message['type'] == 'paragraph':
+            stats = await run_remote_exercise(renderer, reader, writer, message['text'])
+            aggregator.add(stats)
+            checkpoint = message['checkpoint']
+            win.addstr('Press <ENTER> to continue...')
+            win.refresh()
+            await wait_for_enter(win)
+            writer.write(encode_message('next'))
+
+    async def wait_to_exit():
+        await asyncio.sleep(1)
+        curses.flushinp()
+        try:
+            win.addstr('\nPress <ENTER> to continue...')
+        except curses.error:
+            pass
+        await wait_for_enter(win)
+
+    try:
+        if await run_interruptible(run_exercises()):
+            curses.flushinp()
+
+        try:
+            draw_summary(win, f'Congratulations! Your exercise is done.\n\n{render_aggregate_stats_as_list(aggregator.stats())}')
+            win.refresh()
+        except curses.error:
+            pass
+
+        await run_interruptible(wait_to_exit())
+
+    finally:
+        writer.close()
+
+    aggregate_stats = aggregator.stats()
+    if resume_key and aggregate_stats['total_paragraphs'] > 0:
+        save_checkpoint(resume_key, checkpoint)
+    return aggregate_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='typetrain-client', description='Practice some typing with the TypeTrain, on a training server')
+    parser.add_argument('address', help='address of the server (see `main.py --serve`): host:port for TCP, or a path for a Unix socket')
+    parser.add_argument('--resume', action='store_true', help='continue right after the last paragraph written in a previous run')
+    args = parser.parse_args()
+
+    try:
+        aggregate_stats = curses.wrapper(lambda win: asyncio.run(client_app(win, args.address, args.resume)))
+    except (ConnectionError, OSError, ValueError) as e:
+        exit(f'Could not train on {args.address}: {e}')
+
+    if aggregate_stats and aggregate_stats['total_paragraphs'] > 0:
+        print(f'Wrote {aggregate_stats["total_paragraphs"]} paragraphs.\n')
+    else:
+        print('No paragraphs written.\n')
+
+
+if __name__ == '__main__':
+    main()
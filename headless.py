@@ -0,0 +1,178 @@
+import asyncio
+import contextlib
+import curses
+import random
+import time
+from array import array
+
+from keylog import typed_paragraphs
+from renderer import Renderer
+
+
+# Headless driver for the exercise loop: replays keystroke streams (recorded or
+# synthetic) through the real `run_paragraph_exercise`, on a fake curses window
+# that keeps the screen contents in memory. Used for benchmarks and to try
+# changes to the input path without a terminal.
+
+BACKSPACE = '\x7f'
+
+
+class ReplayFinished(Exception): pass
+
+
+# In-memory stand-in for a curses window, implementing the bits of the API the
+# app uses. Writing past the bottom-right corner raises `curses.error`, as
+# curses does. It also measures how long the app takes to process each key: the
+# time from `get_wch` returning it to the next `get_wch` call
+class FakeWindow:
+
+    def __init__(self, keys, height=24, width=80):
+        self.keys = iter(keys)
+        self.height = height
+        self.width = width
+        self.cells = {}
+        self.y = self.x = 0
+        self.key_processing_times = array('d')
+        self._key_returned_at = None
+
+
+    def getmaxyx(self):
+        return (self.height, self.width)
+
+
+    def getyx(self):
+        return (self.y, self.x)
+
+
+    def move(self, y, x):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise curses.error(f'move({y}, {x}) out of the window')
+        self.y, self.x = y, x
+
+
+    def addstr(self, *args):
+        if len(args) >= 3 and isinstance(args[0], int):
+            self.move(args[0], args[1])
+            text = args[2]
+        else:
+            text = args[0]
+
+        for char in text:
+            if char == '\n':
+                self.cells.update({(self.y, x): ' ' for x in range(self.x, self.width)})
+                self._advance(self.width - self.x)
+                continue
+            self.cells[(self.y, self.x)] = char
+            self._advance(1)
+
+
+    def clear(self):
+        self.cells.clear()
+        self.y = self.x = 0
+
+
+    erase = clear
+
+
+    def clrtobot(self):
+        self.cells = {cell: char for cell, char in self.cells.items() if cell < (self.y, self.x)}
+
+
+    def refresh(self):
+        pass
+
+
+    noutrefresh = refresh
+
+
+    def get_wch(self):
+        now = time.perf_counter()
+        if self._key_returned_at is not None:
+            self.key_processing_times.append(now - self._key_returned_at)
+        try:
+            key = next(self.keys)
+        except StopIteration:
+            raise ReplayFinished()
+        self._key_returned_at = time.perf_counter()
+        return key
+
+
+    def nodelay(self, flag):
+        pass
+
+
+    # The screen contents, as a list of lines
+    def lines(self):
+        return [
+            ''.join(self.cells.get((y, x), ' ') for x in range(self.width)).rstrip()
+            for y in range(self.height)
+        ]
+
+
+    def _advance(self, columns):
+        self.x += columns
+        if self.x >= self.width:
+            self.y, self.x = self.y + 1, 0
+        if self.y >= self.height:
+            self.y, self.x = self.height - 1, self.width - 1
+            raise curses.error('addstr() past the end of the window')
+
+
+# Replaces the curses functions that need a real terminal for the duration of
+# the block
+@contextlib.contextmanager
+def headless_curses():
+    replacements = {
+        'init_pair': lambda *_: None,
+        'color_pair': lambda n: n << 8,
+        'doupdate': lambda: None,
+        'flushinp': lambda: None,
+    }
+    originals = {name: getattr(curses, name) for name in replacements}
+    try:
+        for name, replacement in replacements.items():
+            setattr(curses, name, replacement)
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(curses, name, original)
+
+
+# Runs an exercise with the given keys. Returns the stats (None if the keys
+# ran out before the end of the exercise) and the window (with the final screen
+# and the processing time of each key)
+def replay(exercise_txt, keys, height=24, width=80, **kwargs):
+    from main import run_paragraph_exercise
+
+    win = FakeWindow(keys, height, width)
+    with headless_curses():
+        try:
+            stats = asyncio.run(run_paragraph_exercise(Renderer(win), exercise_txt, **kwargs))
+        except ReplayFinished:
+            stats = None
+    return stats, win
+
+
+# Keys typing the text, with typos fixed right away at `typo_rate` and bursts
+# of several chars typed past a typo (and then deleted) at `burst_rate`
+def synthetic_keystrokes(text, typo_rate=0.03, burst_rate=0.01, max_burst=6, rng=random):
+    keys = []
+    idx = 0
+    while idx < len(text):
+        roll = rng.random()
+        if roll < burst_rate and idx + 1 < len(text):
+            burst = rng.randint(2, max_burst)
+            typed = ['#'] + list(text[idx + 1:idx + burst])
+            keys += typed + [BACKSPACE] * len(typed)
+        elif roll < burst_rate + typo_rate:
+            keys += ['#', BACKSPACE]
+        keys.append(text[idx])
+        idx += 1
+    return keys
+
+
+# Paragraphs in keystroke log records (see `keylog.typed_paragraphs`), as the
+# text and keys to replay each one
+def paragraphs_from_records(records):
+    for _, text, keys, _ in typed_paragraphs(records):
+        yield text, [BACKSPACE if key == '\b' else key for key in keys]
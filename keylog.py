@@ -0,0 +1,301 @@
+import bisect
+import mmap
+import os
+import struct
+import time
+
+from paragraph_state import ParagraphState
+from storage import lock_file, storage_path
+
+
+# Append-only log of every keystroke ever typed, for training history.
+#
+# Each keystroke is a fixed-width record: timestamp, expected char, typed char
+# (both as code points) and the resulting char state (as its ASCII code).
+# Backspaces are logged with '\b' as the typed char, and a record with both
+# chars set to 0 marks the start of a paragraph.
+#
+# Alongside there's an index with the running totals at the end of each block
+# of BLOCK_RECORDS records. As records are sorted by time, the stats of any
+# date range come from a binary search for both ends, the difference of the
+# running totals at them, and scanning less than two blocks of records.
+#
+# Only one process can write to a given log at a time: opening it otherwise
+# locks it, and fails with `InUse` while it's locked. Any number can read it
+# meanwhile, opening it read-only.
+class KeystrokeLog:
+
+    class InUse(RuntimeError): pass
+
+    RECORD = struct.Struct('<dIIB3x')
+    INDEX_ENTRY = struct.Struct('<QQQQQd')
+    BLOCK_RECORDS = 1024
+
+    BACKSPACE = ord('\b')
+    PARAGRAPH_START = 0
+
+    # Longer pauses between keystrokes don't count as typing time
+    MAX_ACTIVE_GAP_S = 5
+
+    DEFAULT_NAME = os.path.join('history', 'keystrokes')
+
+    # Totals tracked by the index, in order
+    TOTALS = ('keystrokes', 'correct', 'amended', 'wrong', 'backspaces', 'active_time_s')
+
+    _STATE_TOTAL = {
+        ord(ParagraphState.CHAR_CORRECT): 1,
+        ord(ParagraphState.CHAR_AMENDED): 2,
+        ord(ParagraphState.CHAR_WRONG): 3,
+    }
+
+
+    # Read-only logs must exist already (FileNotFoundError otherwise), and
+    # leave the files as they are: a partial record at the end is ignored
+    # rather than dropped, as it may be one a running session is writing
+    def __init__(self, path=None, read_only=False):
+        path = path or storage_path(self.DEFAULT_NAME)
+        self.records_path = path + '.bin'
+        self.index_path = path + '.idx'
+        self.read_only = read_only
+
+        mode = 'rb' if read_only else 'ab+'
+        self._records_file = open(self.records_path, mode)
+        if not read_only:
+            try:
+                lock_file(self._records_file, wait=False)
+            except BlockingIOError:
+                self._records_file.close()
+                raise self.InUse(f'The keystroke log {self.records_path} is being written by another process')
+        self._index_file = open(self.index_path, mode)
+        self._buffer = bytearray()
+        self._pending_index_entries = bytearray()
+
+        # Drop any partial record left by a crash, and then bring the index up
+        # to date with the records
+        total_records = os.path.getsize(self.records_path) // self.RECORD.size
+        index_entries = min(os.path.getsize(self.index_path) // self.INDEX_ENTRY.size, total_records // self.BLOCK_RECORDS)
+        if not read_only:
+            self._records_file.truncate(total_records * self.RECORD.size)
+            self._index_file.truncate(index_entries * self.INDEX_ENTRY.size)
+
+        # Blocks with their index entry on disk. When read-only, the index can
+        # lag behind the records, as the entries of the rest stay in memory
+        self._indexed_blocks = index_entries
+
+        self.record_count = index_entries * self.BLOCK_RECORDS
+        self._totals = list(self._index_entry(index_entries - 1)) if index_entries else [0] * len(self.TOTALS)
+        self._last_record = next(self._records(self.record_count - 1, self.record_count)) if self.record_count else None
+        for record in list(self._records(self.record_count, total_records)):
+            self._account(record)
+        self.flush()
+
+
+    def close(self):
+        self.flush()
+        self._records_file.close()
+        self._index_file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+    def log_paragraph_start(self):
+        self._append(self.PARAGRAPH_START, self.PARAGRAPH_START, ParagraphState.CHAR_PENDING)
+
+
+    def log_char(self, expected_char, typed_char, char_state):
+        self._append(ord(expected_char), ord(typed_char), char_state)
+
+
+    def log_backspace(self, deleted_char):
+        self._append(ord(deleted_char), self.BACKSPACE, ParagraphState.CHAR_PENDING)
+
+
+    def flush(self):
+        if self.read_only:
+            return
+        self._indexed_blocks += len(self._pending_index_entries) // self.INDEX_ENTRY.size
+        self._records_file.write(self._buffer)
+        self._records_file.flush()
+        self._buffer.clear()
+        self._index_file.write(self._pending_index_entries)
+        self._index_file.flush()
+        self._pending_index_entries.clear()
+
+
+    # Aggregate stats of the keystrokes in [since, until), as Unix timestamps
+    # (either can be None for an open range)
+    def query(self, since=None, until=None):
+        self.flush()
+        if self.record_count == 0:
+            return self._stats_from_totals([0] * len(self.TOTALS))
+
+        with open(self.records_path, 'rb') as f:
+            records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.index_path, 'rb') as f:
+            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._indexed_blocks > 0 else None
+
+        try:
+            first, last = self._record_range(records, since, until)
+            if last <= first:
+                return self._stats_from_totals([0] * len(self.TOTALS))
+            first_totals = self._totals_before(first, records, index)
+            last_totals = self._totals_before(last, records, index)
+        finally:
+            records.close()
+            if index is not None:
+                index.close()
+
+        return self._stats_from_totals([b - a for a, b in zip(first_totals, last_totals)])
+
+
+    # The raw records in [since, until), as (timestamp, expected, typed,
+    # char_state) tuples
+    def records(self, since=None, until=None):
+        self.flush()
+        if self.record_count == 0:
+            return
+
+        with open(self.records_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as records:
+            first, last = self._record_range(records, since, until)
+            chunk_size = self.BLOCK_RECORDS * self.RECORD.size
+            for offset in range(first * self.RECORD.size, last * self.RECORD.size, chunk_size):
+                yield from self.RECORD.iter_unpack(records[offset:min(offset + chunk_size, last * self.RECORD.size)])
+
+
+    def _record_range(self, records, since, until):
+        timestamps = _RecordTimestamps(records, self.RECORD)
+        first = bisect.bisect_left(timestamps, since) if since is not None else 0
+        last = bisect.bisect_left(timestamps, until) if until is not None else len(timestamps)
+        return first, last
+
+
+    def _append(self, expected, typed, char_state):
+        if self.read_only:
+            raise ValueError('The keystroke log is open read-only')
+        record = (time.time(), expected, typed, ord(char_state))
+        self._buffer += self.RECORD.pack(*record)
+        self._account(record)
+        if len(self._buffer) >= self.BLOCK_RECORDS * self.RECORD.size:
+            self.flush()
+
+
+    # Adds the record to the running totals, queuing an index entry when a
+    # block is complete
+    def _account(self, record):
+        self._add_to_totals(self._totals, record, self._last_record)
+        self._last_record = record
+        self.record_count += 1
+        if self.record_count % self.BLOCK_RECORDS == 0:
+            self._pending_index_entries += self.INDEX_ENTRY.pack(*self._totals)
+
+
+    @classmethod
+    def _add_to_totals(cls, totals, record, previous_record):
+        timestamp, expected, typed, char_state = record
+        if typed == cls.PARAGRAPH_START and expected == cls.PARAGRAPH_START:
+            return
+
+        if typed == cls.BACKSPACE:
+            totals[4] += 1
+        else:
+            totals[0] += 1
+            state_total = cls._STATE_TOTAL.get(char_state)
+            if state_total is not None:
+                totals[state_total] += 1
+
+        # Time since the previous keystroke in the same paragraph
+        if previous_record is not None and not (previous_record[1] == previous_record[2] == cls.PARAGRAPH_START):
+            gap = timestamp - previous_record[0]
+            if 0 < gap <= cls.MAX_ACTIVE_GAP_S:
+                totals[5] += gap
+
+
+    # Totals of the records before the given one: the ones of the last complete
+    # (and indexed) block plus the ones of the records after it
+    def _totals_before(self, record_idx, records, index):
+        block = min(record_idx // self.BLOCK_RECORDS, self._indexed_blocks)
+        if block > 0:
+            totals = list(self.INDEX_ENTRY.unpack_from(index, (block - 1) * self.INDEX_ENTRY.size))
+        else:
+            totals = [0] * len(self.TOTALS)
+
+        block_start = block * self.BLOCK_RECORDS
+        previous_record = self.RECORD.unpack_from(records, (block_start - 1) * self.RECORD.size) if block_start > 0 else None
+        for offset in range(block_start * self.RECORD.size, record_idx * self.RECORD.size, self.RECORD.size):
+            record = self.RECORD.unpack_from(records, offset)
+            self._add_to_totals(totals, record, previous_record)
+            previous_record = record
+        return totals
+
+
+    def _stats_from_totals(self, totals):
+        stats = dict(zip(self.TOTALS, totals))
+        keystrokes = stats['keystrokes']
+        active_time_m = stats['active_time_s'] / 60
+        stats['accuracy'] = (keystrokes - stats['wrong']) * 100 / keystrokes if keystrokes > 0 else 0
+        stats['gross_wpm'] = keystrokes / 5 / active_time_m if active_time_m > 0 else 0
+        return stats
+
+
+    def _index_entry(self, entry_idx):
+        self._index_file.seek(entry_idx * self.INDEX_ENTRY.size)
+        return self.INDEX_ENTRY.unpack(self._index_file.read(self.INDEX_ENTRY.size))
+
+
+    def _records(self, first, last):
+        self._records_file.seek(first * self.RECORD.size)
+        data = self._records_file.read((last - first) * self.RECORD.size)
+        return self.RECORD.iter_unpack(data)
+
+
+# Splits records (see `KeystrokeLog.records`) into the paragraphs typed,
+# yielding each one's start time, text, keys (with '\b' for backspaces) and
+# key times. Only the text typed is logged, so the text of paragraphs left
+# unfinished ends where they were left
+def typed_paragraphs(records):
+    start_time, text_chars, keys, times, cursor = None, None, [], [], 0
+    for timestamp, expected, typed, _ in records:
+        if expected == typed == KeystrokeLog.PARAGRAPH_START:
+            if keys:
+                yield start_time, ''.join(text_chars), ''.join(keys), times
+            start_time, text_chars, keys, times, cursor = timestamp, [], [], [], 0
+            continue
+
+        # Records before the first paragraph start can't be placed
+        if text_chars is None:
+            continue
+
+        times.append(timestamp)
+        if typed == KeystrokeLog.BACKSPACE:
+            keys.append('\b')
+            cursor -= 1
+        else:
+            keys.append(chr(typed))
+            if cursor == len(text_chars):
+                text_chars.append(chr(expected))
+            cursor += 1
+
+    if keys:
+        yield start_time, ''.join(text_chars), ''.join(keys), times
+
+
+# Sequence view over the timestamps of the records in a mapped log, for bisect
+class _RecordTimestamps:
+
+    def __init__(self, records, record_struct):
+        self.records = records
+        self.record_struct = record_struct
+
+
+    def __len__(self):
+        return len(self.records) // self.record_struct.size
+
+
+    def __getitem__(self, idx):
+        return self.record_struct.unpack_from(self.records, idx * self.record_struct.size)[0]
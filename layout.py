@@ -0,0 +1,153 @@
+from array import array
+
+
+# Maps every character index of an exercise text to its (y, x) position in the
+# text area and back, so the exercise loop never has to work out cursor moves
+# by hand.
+#
+# The text is wrapped by words, one hard line (text between '\n's) at a time.
+# Rows are contiguous slices of the text: the whitespace a row breaks at stays
+# at its end, as does the '\n' closing a hard line, so every character the user
+# has to type has a cell on screen. Rows hold up to `width` characters plus
+# that trailing space/newline, hence callers should pass the window width
+# minus one.
+#
+# Per character only the hard line and the row within that hard line are
+# stored. The first (global) row of each hard line is kept separately, so on
+# resize only hard lines whose wrapping actually changes get recomputed.
+class TextLayout:
+
+    def __init__(self, text, width):
+        self.text = text
+        self.width = max(1, width)
+
+        self.length_txt = len(text)
+        self.char_hard_line = array('I', bytes(4 * self.length_txt))
+        self.char_row_in_line = array('I', bytes(4 * self.length_txt))
+
+        # Start and end (excluding the '\n') of each hard line
+        self.hard_line_bounds = []
+        start = 0
+        while (end := text.find('\n', start)) != -1:
+            self.hard_line_bounds.append((start, end))
+            start = end + 1
+        self.hard_line_bounds.append((start, self.length_txt))
+
+        # Text index where each row of each hard line starts
+        self.line_row_starts = [None] * len(self.hard_line_bounds)
+        for line_idx in range(len(self.hard_line_bounds)):
+            self._wrap_hard_line(line_idx)
+        self._update_rows()
+
+
+    def resize(self, width):
+        width = max(1, width)
+        if width == self.width:
+            return
+        previous_width, self.width = self.width, width
+
+        # Lines that fit in a single row both before and after don't change
+        untouched_max_length = min(previous_width, width)
+        for line_idx, (start, end) in enumerate(self.hard_line_bounds):
+            if end - start > untouched_max_length:
+                self._wrap_hard_line(line_idx)
+        self._update_rows()
+
+
+    @property
+    def row_count(self):
+        return len(self.row_starts)
+
+
+    def position(self, idx):
+        # One past the last character (where the cursor rests when done)
+        if idx >= self.length_txt:
+            if self.length_txt == 0:
+                return (0, 0)
+            y, x = self.position(self.length_txt - 1)
+            return (y, x + 1)
+
+        row = self.line_first_row[self.char_hard_line[idx]] + self.char_row_in_line[idx]
+        return (row, idx - self.row_starts[row])
+
+
+    def index_at(self, y, x):
+        if not 0 <= y < self.row_count or x < 0:
+            return None
+        idx = self.row_starts[y] + x
+        return idx if idx < self._row_end(y) else None
+
+
+    def row_span(self, y):
+        return (self.row_starts[y], self._row_end(y))
+
+
+    def _row_end(self, y):
+        return self.row_starts[y + 1] if y + 1 < self.row_count else self.length_txt
+
+
+    def _wrap_hard_line(self, line_idx):
+        start, end = self.hard_line_bounds[line_idx]
+
+        # Greedy word wrap. A row can take `width` characters plus the space
+        # it breaks at. Words longer than a row are split
+        row_starts = [start]
+        row_start = start
+        while end - row_start > self.width:
+            break_idx = self.text.rfind(' ', row_start, row_start + self.width + 1)
+            row_start = break_idx + 1 if break_idx > row_start else row_start + self.width
+            row_starts.append(row_start)
+        self.line_row_starts[line_idx] = array('I', row_starts)
+
+        # The closing '\n' (if any) belongs to the last row of the line
+        line_end = min(end + 1, self.length_txt)
+        self.char_hard_line[start:line_end] = array('I', [line_idx]) * (line_end - start)
+        for row, row_start in enumerate(row_starts):
+            row_end = row_starts[row + 1] if row + 1 < len(row_starts) else line_end
+            self.char_row_in_line[row_start:row_end] = array('I', [row]) * (row_end - row_start)
+
+
+    def _update_rows(self):
+        self.line_first_row = array('I', bytes(4 * len(self.line_row_starts)))
+        self.row_starts = array('I')
+        for line_idx, row_starts in enumerate(self.line_row_starts):
+            self.line_first_row[line_idx] = len(self.row_starts)
+            self.row_starts.extend(row_starts)
+
+
+# Window over the rows of a TextLayout, for texts taller than the screen. Only
+# the rows in it get drawn, so the cost of a redraw depends on the screen size
+# and not on the length of the text.
+class Viewport:
+
+    def __init__(self, layout, height):
+        self.layout = layout
+        self.height = max(1, height)
+        self.top = 0
+
+
+    def resize(self, height):
+        self.height = max(1, height)
+        self.top = min(self.top, self._max_top())
+
+
+    @property
+    def rows(self):
+        return range(self.top, min(self.top + self.height, self.layout.row_count))
+
+
+    def is_visible(self, row):
+        return self.top <= row < self.top + self.height
+
+
+    # Scrolls (if needed) so the row is visible, leaving some context above it.
+    # Returns whether the viewport moved
+    def scroll_to(self, row):
+        if self.is_visible(row):
+            return False
+        self.top = max(0, min(row - self.height // 3, self._max_top()))
+        return True
+
+
+    def _max_top(self):
+        return max(0, self.layout.row_count - self.height)
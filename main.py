@@ -1,11 +1,66 @@
 import argparse
+import asyncio
 import curses
-import textwrap
-import time
-import unicodedata
+import signal
+import sys
 
+from analytics import KeystrokeSamples, latency_tables, slowest_bigrams
+from checkpoints import load_checkpoint, save_checkpoint
+from keylog import KeystrokeLog
+from layout import TextLayout, Viewport
 from paragraph_state import ParagraphState
-from plugins import get_plugins
+from plugins import async_paragraphs_with_checkpoints, get_plugin_manifest, load_plugin, paragraphs_with_checkpoints
+from prefetch import AsyncPrefetcher, Prefetcher
+from renderer import Renderer
+from rolling_metrics import RollingMetrics
+from sanitize import sanitize_text
+from server import TrainingServer
+from stats_aggregator import StatsAggregator, add_to_daily_rollup, recent_rollup
+from stats_text import render_aggregate_stats_as_list, render_slowest_bigrams, render_stats_as_list
+from tracing import save_trace, span, start_tracing, traced
+
+
+# First row of the screen used to display the exercise text (below the header)
+TEXT_TOP = 2
+
+# Rows needed to display the stats after an exercise (see `run_paragraph_exercise`)
+STATS_HEIGHT = 11
+
+# Rows kept below the summary at the end, for the prompt to exit (see
+# `draw_summary`)
+EXIT_PROMPT_HEIGHT = 2
+
+# Columns at the right of the screen not used by the text (room for the
+# trailing space/newline of each row and the border)
+TEXT_RIGHT_MARGIN = 2
+
+# How often the header stats are refreshed while the user is not typing, so
+# they keep up with the time passing
+LIVE_STATS_INTERVAL_S = 0.25
+
+# Terminal resizes don't show up as input on stdin, so when waiting for keys
+# the window is checked at least this often
+KEY_POLL_INTERVAL_S = 0.1
+
+# Days summed up from the history after each session
+WEEK_DAYS = 7
+
+TREND_ARROWS = {1: '↑', 0: '=', -1: '↓'}
+
+# Fields that can be shown on the header (see `--header`), as {name: (label,
+# width of the value, value from the stats)}. The stats of the paragraph come
+# along with the rolling ones (see `RollingMetrics.stats`), when available
+HEADER_FIELDS = {
+    'wpm': ('WPM:', 9, lambda stats: f'{stats["net_wpm"]:.0f} ({stats["gross_wpm"]:.0f})'),
+    'accuracy': ('Accuracy:', 11, lambda stats: f'{stats["result_accuracy"]:.0f}% ({stats["real_accuracy"]:.0f}%)'),
+    'progress': ('Progress:', 4, lambda stats: f'{stats["progress_pct"]:.0f}%'),
+    'wpm5': ('5s:', 3, lambda stats: f'{stats["wpm_5s"]:.0f}'),
+    'wpm15': ('15s:', 3, lambda stats: f'{stats["wpm_15s"]:.0f}'),
+    'wpm60': ('60s:', 3, lambda stats: f'{stats["wpm_60s"]:.0f}'),
+    'burst': ('Peak:', 3, lambda stats: f'{stats["peak_burst_wpm"]:.0f}'),
+    'trend': ('Recent acc.:', 5, lambda stats: f'{stats["accuracy_15s"]:.0f}%{TREND_ARROWS[stats["accuracy_trend"]]}' if stats['accuracy_15s'] is not None else '-'),
+}
+DEFAULT_HEADER = ('wpm', 'accuracy', 'progress')
 
 
 # From https://stackoverflow.com/questions/9647202/ordinal-numbers-replacement
@@ -17,202 +72,395 @@ def ordinal(n):
     return str(n) + suffix
 
 
-def update_stats_heading(win, stats):
-    curses.init_pair(1, curses.COLOR_BLUE, curses.COLOR_BLACK)
-    HEADER_COLORS = curses.color_pair(1)
+def update_stats_heading(renderer, stats, force=False, rolling=None, fields=DEFAULT_HEADER):
+    # Throttled to the renderer's header frame rate, unless forced
+    if not renderer.header_frame_due(force):
+        return
+    with span('header'):
+        if rolling is not None:
+            stats = dict(stats, **rolling.stats())
+        draw_stats_heading(renderer, stats, fields)
+
+
+def draw_stats_heading(renderer, stats, fields=DEFAULT_HEADER):
+    _, win_width = renderer.win.getmaxyx()
+
+    # Calculate spacing according to the win size, spreading the fields over
+    # the whole width (but the last column). Each one takes its label, a space
+    # and its value
+    usable_width = win_width - 1
+    widths = [len(HEADER_FIELDS[field][0]) + 1 + HEADER_FIELDS[field][1] for field in fields]
+    spacing_between_fields = max(1, (usable_width - sum(widths)) // (len(fields) - 1)) if len(fields) > 1 else 0
+
+    # Add each label and its value to the side, as long as they fit
+    x = 0
+    for idx, (field, width) in enumerate(zip(fields, widths)):
+        if x + width > usable_width:
+            break
+        label, value_width, value = HEADER_FIELDS[field]
+        value_x = x + len(label) + 1
+        if idx < len(fields) - 1:
+            value_width += spacing_between_fields
+        renderer.put(0, x, label + ' ', renderer.header_colors)
+        renderer.put(0, value_x, value(stats).ljust(value_width)[:usable_width - value_x])
+        x += width + spacing_between_fields
+
+
+# Keeps refreshing the header stats of the exercise at a fixed rate, until
+# cancelled. Runs while the exercise loop waits for keys
+async def tick_stats_heading(renderer, state, rolling=None, fields=DEFAULT_HEADER):
+    while True:
+        await asyncio.sleep(LIVE_STATS_INTERVAL_S)
+        if state.start_time is not None:
+            update_stats_heading(renderer, state.stats(), force=True, rolling=rolling, fields=fields)
+            renderer.flush()
+
+
+# Reads a key from the window (which must be in no-delay mode) without
+# blocking the event loop
+async def read_key(win):
+    while True:
+        try:
+            return win.get_wch()
+        except curses.error:
+            await wait_for_input(KEY_POLL_INTERVAL_S)
 
-    initial_position = list(win.getyx())
-    _, win_width = win.getmaxyx()
 
-    # Calculate spacing according to the win size
-    # Labels, values and minimum spacing takes 5+9 + 10+11 + 10+4 = 49 characters
-    spacing_between_fields = (win_width - 49) // 2
-    wpm_val_ljustify_len = 9 + spacing_between_fields
-    accuracy_val_ljustify_len = 11 + spacing_between_fields
-    progress_val_ljustify_len = 4
-
-    # Add labels to the top
-    win.addstr(0, 0, 'WPM:'.ljust(5 + wpm_val_ljustify_len) + \
-        'Accuracy:'.ljust(10 + accuracy_val_ljustify_len) + \
-        'Progress:', HEADER_COLORS)
-
-    # More spacing calculation, specific for values
-    wpm_start_x = 5
-    accuracy_starts_x = wpm_start_x + wpm_val_ljustify_len + 10
-    progress_starts_x = accuracy_starts_x + accuracy_val_ljustify_len + 10
-
-    # Add values to the side of the labels
-    win.move(0, 0)
-    win.addstr(0, wpm_start_x, f'{stats["net_wpm"]:.0f} ({stats["gross_wpm"]:.0f})'.ljust(wpm_val_ljustify_len))
-    win.addstr(0, accuracy_starts_x, f'{stats["result_accuracy"]:.0f}% ({stats["real_accuracy"]:.0f}%)'.ljust(accuracy_val_ljustify_len))
-    win.addstr(0, progress_starts_x, f'{stats["progress_pct"]:.0f}%'.ljust(progress_val_ljustify_len))
-
-    win.move(*initial_position)
-
-
-def render_stats_as_list(stats):
-    return (
-        f'WPM: {stats["net_wpm"]:.2f}, {stats["gross_wpm"]:.2f} gross\n'
-        f'Accuracy: {stats["result_accuracy"]:.2f}%, {stats["real_accuracy"]:.2f}% real\n'
-        f'Errors: {stats["error_count"]}, {stats["uncorrected_error_count"]} not corrected\n'
-        f'Excercise Length: {stats["length_txt"]} chars, {stats["length_std_words"]:.2f} "standard" words\n'
-        f'Time: {stats["time_s"]:.2f} s\n'
-    )
-
-
-def render_aggregate_stats_as_list(agg_stats):
-    return (
-        f'Average WPM: {agg_stats["net_wpm"]:.2f} ({agg_stats["gross_wpm"]:.2f} gross)\n'
-        f'Average accuracy: {agg_stats["result_accuracy"]:.2f}% ({agg_stats["real_accuracy"]:.2f}% real)\n'
-        f'Errors: {agg_stats["error_count"]} ({agg_stats["uncorrected_error_count"]} not corrected)\n'
-        f'Total exercises length: {agg_stats["total_length_txt"]} chars, {agg_stats["total_length_std_words"]:.2f} "standard" words\n'
-        f'Total paragraphs: {agg_stats["total_paragraphs"]}\n'
-        f'Correct paragraphs: {agg_stats["correct_paragraphs"]} ({agg_stats["correct_paragraphs_pct"]:.2f}%)\n'
-        f'Total typing time: {agg_stats["time_m"]:.2f} minutes\n'
-    )
-
-
-def sanitize_text(user_text):
-    # Unicode combining characters take space on the string, but not on the
-    # screen, messing up UI calculations. The line is then normalized to NFKC.
-    # This way we have no combining characters, and have the resulting combined
-    # characters be the canonical equivalent form, most probably the one the
-    # keyboard/terminal/OS will deliver (untested assumption but makes sense :p).
-    # EDIT: Already used the app with different text pulled from different
-    # places of the internet and has not given any problems so far :)
-    normalized_text = unicodedata.normalize('NFKC', user_text)
-
-    # Replace characters that are not easily typeable
-    # TODO: Make this an option? There are weird ways to type these...
-    return normalized_text.translate(str.maketrans("–‘’“”", "-''\"\"")).replace("…", "...")
-
-
-def run_paragraph_exercise(win, exercise_txt):
-    curses.init_pair(10, curses.COLOR_CYAN, curses.COLOR_BLACK)
-    curses.init_pair(11, curses.COLOR_GREEN, curses.COLOR_BLACK)
-    curses.init_pair(12, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-    curses.init_pair(13, curses.COLOR_WHITE, curses.COLOR_RED)
+async def wait_for_input(timeout):
+    loop = asyncio.get_running_loop()
+    input_ready = loop.create_future()
+    stdin_fd = sys.stdin.fileno()
+    loop.add_reader(stdin_fd, lambda: input_ready.done() or input_ready.set_result(None))
+    try:
+        await asyncio.wait([input_ready], timeout=timeout)
+    finally:
+        loop.remove_reader(stdin_fd)
 
-    COLORS_BY_STATE = {
-        ParagraphState.CHAR_PENDING: curses.color_pair(10),
-        ParagraphState.CHAR_CORRECT: curses.color_pair(11),
-        ParagraphState.CHAR_AMENDED: curses.color_pair(12),
-        ParagraphState.CHAR_WRONG: curses.color_pair(13),
-    }
 
-    exercise_txt = sanitize_text(exercise_txt)
+async def wait_for_enter(win):
+    while await read_key(win) != '\n':
+        pass
+
+
+# Runs the coroutine until it's done or the user hits Ctrl+C. Returns whether
+# it was interrupted
+async def run_interruptible(coroutine):
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(coroutine)
+    loop.add_signal_handler(signal.SIGINT, task.cancel)
+    try:
+        await task
+        return False
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        return True
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
 
-    # Draw the initial state of the screen
-    win.clear()
-    state = ParagraphState(exercise_txt)
-    update_stats_heading(win, state.stats())  # Will be all zeroes
 
-    # Get window dimensions
+# Draws the summary at the end on a cleared window, followed by as many of the
+# `extra` lines (a heading and its rows, e.g. the slowest bigrams) as fit,
+# leaving room for the prompt to exit below. Whatever else doesn't fit is left
+# out, and lines are cut to the width of the window
+def draw_summary(win, summary, extra=''):
     max_y, max_x = win.getmaxyx()
-    max_x -= 1  # Adjust for border
-
-    # Split text into lines and wrap by words
-    lines = exercise_txt.split('\n')
-    wrapped_lines = []
-    for line in lines:
-        wrapped_lines.extend(textwrap.wrap(line, width=max_x))
-
-    # Display the wrapped text
-    for i, line in enumerate(wrapped_lines):
-        win.addstr(i + 2, 0, line, COLORS_BY_STATE[ParagraphState.CHAR_PENDING])
-    win.move(2, 0)
-
-    # Loop to handle key-presses
-    while not state.is_exercise_done():
-        key = win.get_wch()
-
-        # Handle backspace (POSIX, Windows)
-        if key in ('\x7f', '\x08'):
-            try:
-                deleted_char = state.register_backspace()
-            except ParagraphState.AlreadyAtBeggining:
-                continue
+    rows = max(0, max_y - EXIT_PROMPT_HEIGHT)
+    lines = summary.splitlines()
+    extra_lines = extra.splitlines()
+    extra_rows = rows - len(lines) - 1
+    if extra_lines and extra_rows >= 2:
+        lines += [''] + extra_lines[:extra_rows]
+    lines = lines[:rows]
 
-            last_position = list(win.getyx())
+    win.clear()
+    for y, line in enumerate(lines):
+        win.addnstr(y, 0, line, max_x - 1)
+    win.move(len(lines), 0)
 
-            # Handle line wrapping going backwards
-            if last_position[1] == 0:
-                last_position[0] -= 1
-                last_position[1] = len(lines[last_position[0] - 2])
-            else:
-                last_position[1] -= 1
 
-            win.addstr(*last_position, deleted_char, COLORS_BY_STATE[ParagraphState.CHAR_PENDING])
-            win.move(*last_position)
+# Sanitizes and wraps a paragraph for a screen `win_width` columns wide. Can
+# run ahead of time, off the UI thread (see `curses_app`)
+def prepare_exercise(paragraph, win_width):
+    return TextLayout(sanitize_text(paragraph), win_width - TEXT_RIGHT_MARGIN)
 
-        # Handle regular printable characters and newlines (enter key)
-        elif (type(key) == str and key.isprintable()) or key == '\n':
-            char_state = state.register_char(key)
-            if key == '\n' and char_state == ParagraphState.CHAR_WRONG:
-                key = '↵'
-            win.addstr(key, COLORS_BY_STATE[char_state])
 
-        # Other key-presses produce ints or non-printable strings
-        else:
+# Characters as shown on the text area. Newlines take a cell at the end of
+# their line, blank unless typed wrong
+def display_char(char, char_state=None):
+    if char == '\n':
+        return '↵' if char_state == ParagraphState.CHAR_WRONG else ' '
+    return char
+
+
+def draw_exercise_text(renderer, viewport, state, colors_by_state):
+    layout = viewport.layout
+    for screen_row in range(viewport.height):
+        y = viewport.top + screen_row
+        screen_y = TEXT_TOP + screen_row
+        if y >= layout.row_count:
+            renderer.put(screen_y, 0, ' ' * (layout.width + 1))
             continue
+        row_start, row_end = layout.row_span(y)
+
+        # Draw runs of characters sharing the same state at once
+        run_start = row_start
+        while run_start < row_end:
+            run_char_state = char_state_to_draw(state, run_start)
+            run_end = run_start + 1
+            while run_end < row_end and char_state_to_draw(state, run_end) == run_char_state:
+                run_end += 1
+            run_text = ''.join(display_char(c, run_char_state) for c in layout.text[run_start:run_end])
+            renderer.put(screen_y, run_start - row_start, run_text, colors_by_state[run_char_state])
+            run_start = run_end
+
+        # Blank whatever was left there by rows previously shown on this line
+        renderer.put(screen_y, row_end - row_start, ' ' * (layout.width + 1 - (row_end - row_start)))
+
+
+# Moves the cursor to the cell of the character, scrolling if needed. Returns
+# the cell's screen position
+def move_to_char(renderer, viewport, state, colors_by_state, idx):
+    y, x = viewport.layout.position(idx)
+    if viewport.scroll_to(y):
+        draw_exercise_text(renderer, viewport, state, colors_by_state)
+    screen_position = (TEXT_TOP + y - viewport.top, x)
+    renderer.move(*screen_position)
+    return screen_position
+
+
+def redraw_exercise(renderer, viewport, state, colors_by_state, stats, rolling=None, fields=DEFAULT_HEADER):
+    renderer.clear()
+    update_stats_heading(renderer, stats, force=True, rolling=rolling, fields=fields)
+    draw_exercise_text(renderer, viewport, state, colors_by_state)
+    move_to_char(renderer, viewport, state, colors_by_state, state.current_char_idx)
+    renderer.flush()
+
+
+# Re-wraps the text to the new size of the window (to redraw it then)
+def resize_exercise(win, viewport):
+    max_y, max_x = win.getmaxyx()
+    viewport.layout.resize(max_x - TEXT_RIGHT_MARGIN)
+    viewport.resize(max_y - TEXT_TOP)
 
-        update_stats_heading(win, state.stats())
 
-    # Exercise done. Move below text to display stats
-    current_position = list(win.getyx())
-    win.move(current_position[0] + 2, 0)
+# Shows the stats of a finished exercise below its text. If they don't fit
+# there, they're shown in place of it
+def draw_exercise_stats(win, viewport, stats):
+    max_y, _ = win.getmaxyx()
+    stats_top = TEXT_TOP + len(viewport.rows) + 1
+    if stats_top + STATS_HEIGHT > max_y:
+        win.move(TEXT_TOP, 0)
+        win.clrtobot()
+        stats_top = TEXT_TOP
+    win.move(stats_top, 0)
 
-    # Display stats
-    stats = state.stats()
     if stats['all_correct']:
         win.addstr('All correct!')
     else:
         win.addstr('Errors have been made...')
     win.addstr(f'\n\n{render_stats_as_list(stats)}\n')
 
-    return stats
+
+# Only the characters before the cursor show their state, as the ones after it
+# have been deleted with backspace
+def char_state_to_draw(state, idx):
+    if idx >= state.current_char_idx:
+        return ParagraphState.CHAR_PENDING
+    return state.char_state(idx)
 
 
-def curses_app(win, selected_plugin, skip):
-    stats_per_paragraph = []
+def init_colors_by_state():
+    curses.init_pair(10, curses.COLOR_CYAN, curses.COLOR_BLACK)
+    curses.init_pair(11, curses.COLOR_GREEN, curses.COLOR_BLACK)
+    curses.init_pair(12, curses.COLOR_YELLOW, curses.COLOR_BLACK)
+    curses.init_pair(13, curses.COLOR_WHITE, curses.COLOR_RED)
+
+    return {
+        ParagraphState.CHAR_PENDING: curses.color_pair(10),
+        ParagraphState.CHAR_CORRECT: curses.color_pair(11),
+        ParagraphState.CHAR_AMENDED: curses.color_pair(12),
+        ParagraphState.CHAR_WRONG: curses.color_pair(13),
+    }
+
+
+async def run_paragraph_exercise(renderer, exercise_txt, layout=None, keylog=None, samples=None, rolling=None, header=DEFAULT_HEADER):
+    win = renderer.win
+    COLORS_BY_STATE = init_colors_by_state()
+
+    # Wrap the text once (unless already prepared, in which case it only
+    # needs adjusting if the screen was resized since). From here on all cursor
+    # positions are lookups. Only the rows that fit in the screen are drawn,
+    # scrolling as the cursor moves
+    max_y, max_x = win.getmaxyx()
+    if layout is None:
+        layout = prepare_exercise(exercise_txt, max_x)
+    else:
+        layout.resize(max_x - TEXT_RIGHT_MARGIN)
+    exercise_txt = layout.text
+    state = ParagraphState(exercise_txt)
+    viewport = Viewport(layout, max_y - TEXT_TOP)
+
+    # Draw the initial state of the screen
+    redraw_exercise(renderer, viewport, state, COLORS_BY_STATE, state.stats(), rolling, header)
+    if keylog:
+        keylog.log_paragraph_start()
+
+    # Loop to handle key-presses. The header stats are also refreshed in the
+    # background meanwhile, so they stay live when the user pauses
+    ticker = asyncio.get_running_loop().create_task(tick_stats_heading(renderer, state, rolling, header))
     try:
+        while not state.is_exercise_done():
+            with span('get_wch'):
+                key = await read_key(win)
+
+            # Handle terminal resizes, re-wrapping the text to the new width
+            if key == curses.KEY_RESIZE:
+                resize_exercise(win, viewport)
+                redraw_exercise(renderer, viewport, state, COLORS_BY_STATE, state.stats(), rolling, header)
+                continue
 
-        # Pull paragraphs (exercises content) from the selected plugin. Then
-        # for each of them run the exercise and store the resulting stats
-        try:
-            for paragraph in selected_plugin.paragraph_generator():
-                paragraph = paragraph.strip()
-                if len(paragraph) == 0:
-                    continue
-                if skip > 0:
-                    skip -= 1
+            # Handle backspace (POSIX, Windows)
+            elif key in ('\x7f', '\x08'):
+                try:
+                    with span('register_backspace'):
+                        deleted_char = state.register_backspace()
+                except ParagraphState.AlreadyAtBeggining:
                     continue
-                stats = run_paragraph_exercise(win, paragraph)
-                stats_per_paragraph.append(stats)
-                win.addstr('Press <ENTER> to continue...')
-                win.refresh()
-                win.getstr()
-        except KeyboardInterrupt:
-            curses.flushinp()
 
-        # After finishing or hitting Ctrl+C, show the aggregate stats and exit
+                y, x = move_to_char(renderer, viewport, state, COLORS_BY_STATE, state.current_char_idx)
+                renderer.put(y, x, display_char(deleted_char), COLORS_BY_STATE[ParagraphState.CHAR_PENDING])
+                if keylog:
+                    keylog.log_backspace(deleted_char)
+
+            # Handle regular printable characters and newlines (enter key)
+            elif (type(key) == str and key.isprintable()) or key == '\n':
+                y, x = renderer.cursor
+                expected_char = exercise_txt[state.current_char_idx]
+                with span('register_char'):
+                    char_state = state.register_char(key)
+                if rolling is not None:
+                    rolling.register_char(char_state == ParagraphState.CHAR_WRONG)
+                renderer.put(y, x, display_char(key, char_state), COLORS_BY_STATE[char_state])
+                move_to_char(renderer, viewport, state, COLORS_BY_STATE, state.current_char_idx)
+                if keylog:
+                    keylog.log_char(expected_char, key, char_state)
+
+            # Other key-presses produce ints or non-printable strings
+            else:
+                continue
+
+            with span('stats'):
+                stats = state.stats()
+            update_stats_heading(renderer, stats, rolling=rolling, fields=header)
+            renderer.flush()
+    finally:
+        ticker.cancel()
+        if rolling is not None:
+            rolling.pause()
+
+    # Exercise done. Draw the final stats on the header and move below text to
+    # display stats
+    update_stats_heading(renderer, state.stats(), force=True, rolling=rolling, fields=header)
+    renderer.flush()
+    if keylog:
+        keylog.flush()
+    if samples is not None:
+        samples.add_paragraph(state)
+
+    stats = state.stats()
+    draw_exercise_stats(win, viewport, stats)
+    return stats
 
-        win.clear()
-        win.addstr('Congratulations! Your exercise is done.\n\n')
 
-        aggregate_stats = ParagraphState.aggregate_multiple_stats(stats_per_paragraph)
-        win.addstr(render_aggregate_stats_as_list(aggregate_stats))
-        win.refresh()
+async def curses_app(win, selected_plugin, skip, checkpoint=None, prefetch=Prefetcher.DEFAULT_DEPTH, keylog=None, header=DEFAULT_HEADER):
+    aggregator = StatsAggregator()
+    samples = KeystrokeSamples()
+    rolling = RollingMetrics()
+    renderer = Renderer(win)
+    _, win_width = win.getmaxyx()
 
-        time.sleep(1)
+    # Keys are read without blocking, so the event loop keeps running (see
+    # `read_key`)
+    win.nodelay(True)
+
+    # Runs on the prefetch worker thread (or on the event loop, for async
+    # plugins). Returns None for paragraphs to drop
+    def prepare(paragraph_and_checkpoint):
+        nonlocal skip
+        paragraph, paragraph_checkpoint = paragraph_and_checkpoint
+        paragraph = paragraph.strip()
+        if len(paragraph) == 0:
+            return None
+        if skip > 0:
+            skip -= 1
+            return None
+        with span('prepare_exercise'):
+            return prepare_exercise(paragraph, win_width), paragraph_checkpoint
+
+    # Each step of the plugin's generator is timed when tracing
+    if hasattr(selected_plugin, 'async_paragraph_generator'):
+        paragraphs = async_paragraphs_with_checkpoints(selected_plugin, checkpoint)
+    else:
+        paragraphs = traced(paragraphs_with_checkpoints(selected_plugin, checkpoint), 'paragraph_generator')
+    exercises = AsyncPrefetcher(paragraphs, prepare, prefetch)
+
+    # Pull paragraphs (exercises content) from the selected plugin, from the
+    # given checkpoint on, prepared in the background a few ahead. Then for
+    # each of them run the exercise and store the resulting stats, along with
+    # the checkpoint to resume after it
+    async def run_exercises():
+        nonlocal checkpoint
+        async for layout, paragraph_checkpoint in exercises:
+            stats = await run_paragraph_exercise(renderer, layout.text, layout, keylog, samples, rolling, header)
+            aggregator.add(stats)
+            checkpoint = paragraph_checkpoint
+            win.addstr('Press <ENTER> to continue...')
+            win.refresh()
+            await wait_for_enter(win)
+
+    async def wait_to_exit():
+        await asyncio.sleep(1)
         curses.flushinp()
-        win.addstr('\nPress <ENTER> to continue...')
-        win.getstr()
+        try:
+            win.addstr('\nPress <ENTER> to continue...')
+        except curses.error:
+            pass
+        await wait_for_enter(win)
+
+    try:
+        if await run_interruptible(run_exercises()):
+            curses.flushinp()
+
+        # After finishing or hitting Ctrl+C, show the aggregate stats and exit.
+        # A window too small for them (even once fit) mustn't lose the session
+        try:
+            draw_summary(
+                win,
+                'Congratulations! Your exercise is done.\n\n'
+                f'{render_aggregate_stats_as_list(aggregator.stats())}'
+                f'Peak speed: {rolling.peak_burst_wpm:.0f} WPM (over {RollingMetrics.BURST_WINDOW_S} seconds)\n',
+                render_slowest_bigrams(slowest_bigrams(latency_tables(samples))),
+            )
+            win.refresh()
+        except curses.error:
+            pass
+
+        await run_interruptible(wait_to_exit())
 
-    except KeyboardInterrupt:
-        pass
     finally:
-        return aggregate_stats
+        exercises.close()
+
+    return aggregator, checkpoint
+
+
+# Parses the value of `--header`
+def header_fields(value):
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in HEADER_FIELDS]
+    if unknown or not fields:
+        raise argparse.ArgumentTypeError(f'unknown header fields: {", ".join(unknown)}' if unknown else 'no header fields given')
+    return fields
 
 
 def main():
@@ -220,28 +468,90 @@ def main():
     # Main CLI argument parser setup
     parser = argparse.ArgumentParser(prog='typetrain', description='Practice some typing with the TypeTrain!')
     parser.add_argument('--skip', type=int, default=0, help='skip the first N paragraphs')
-
-    # CLI argument sub-parsers setup for plugins
+    parser.add_argument('--prefetch', type=int, default=Prefetcher.DEFAULT_DEPTH, help='number of paragraphs to prepare in the background ahead of time')
+    parser.add_argument('--resume', action='store_true', help='continue right after the last paragraph written in a previous run')
+    parser.add_argument('--no-history', action='store_true', help="don't record keystrokes in the training history")
+    parser.add_argument('--serve', metavar='ADDR', help='instead of training here, host training sessions for clients (see client.py) on ADDR: host:port for TCP, or a path for a Unix socket')
+    parser.add_argument('--header', type=header_fields, default=DEFAULT_HEADER, help=f'comma-separated fields to show on the header, out of {", ".join(HEADER_FIELDS)} (default: {",".join(DEFAULT_HEADER)})')
+    parser.add_argument('--trace', metavar='FILE', help='record timings of the input loop and paragraph generation to FILE, in Chrome trace event format (see https://ui.perfetto.dev)')
+
+    # CLI argument sub-parsers setup for plugins. Only the selected plugin is
+    # imported: the rest are listed from the (cached) plugin manifest, and the
+    # selected one gets its arguments configured after a first parsing pass
     subparsers = parser.add_subparsers(required=True, title='exercise types', dest='exercise_type') # TODO restrict, using `choices`?
-    for plugin in get_plugins():
-        plugin_parser = subparsers.add_parser(plugin.one_word_name, help=plugin.description)
-        plugin.configure_argparse_subparser(plugin_parser)
-        plugin_parser.set_defaults(plugin=plugin)
+    plugin_parsers = {}
+    for plugin_name, plugin_info in get_plugin_manifest().items():
+        plugin_parsers[plugin_name] = subparsers.add_parser(plugin_name, help=plugin_info['description'], add_help=False)
 
     # Run argument parser
+    args, _ = parser.parse_known_args()
+    plugin = load_plugin(args.exercise_type)
+    plugin_parser = plugin_parsers[args.exercise_type]
+    plugin_parser.add_argument('-h', '--help', action='help', help='show this help message and exit')
+    plugin.configure_argparse_subparser(plugin_parser)
     args = parser.parse_args()
-    selected_plugin = args.plugin(args)
+    selected_plugin = plugin(args)
 
-    # Run the app
-    aggregate_stats = curses.wrapper(curses_app, selected_plugin, skip=args.skip)
+    # In server mode, sessions are run for clients instead
+    if args.serve:
+        print(f'Serving {args.exercise_type} exercises on {args.serve}. Press Ctrl+C to stop.')
+        try:
+            asyncio.run(TrainingServer(selected_plugin).serve_forever(args.serve))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Sources that can be resumed keep a checkpoint after the last paragraph
+    # written, so a future run can jump straight there
+    resume_key = getattr(selected_plugin, 'resume_key', None)
+    checkpoint = load_checkpoint(resume_key) if args.resume and resume_key else None
+
+    # Run the app. The history can only be written by one app at a time, so
+    # the sessions of the rest are left out of it
+    keylog = history_in_use = None
+    if not args.no_history:
+        try:
+            keylog = KeystrokeLog()
+        except KeystrokeLog.InUse:
+            history_in_use = True
+    if args.trace:
+        start_tracing()
+    try:
+        aggregator, checkpoint = curses.wrapper(lambda win: asyncio.run(
+            curses_app(win, selected_plugin, skip=args.skip, checkpoint=checkpoint, prefetch=args.prefetch, keylog=keylog, header=args.header)
+        ))
+    finally:
+        if keylog:
+            keylog.close()
+        if args.trace:
+            save_trace(args.trace)
 
     # Report last paragraph written before exit (outside curses) to easily
     # continue the exercise in a future run
-    if aggregate_stats and aggregate_stats["total_paragraphs"] > 0:
-        last_written_paragraph_index = aggregate_stats["total_paragraphs"] + args.skip
-        print(f'Last paragraph written was the {ordinal(last_written_paragraph_index)}.\n')
+    aggregate_stats = aggregator.stats()
+    if aggregate_stats["total_paragraphs"] > 0:
+        if resume_key:
+            save_checkpoint(resume_key, checkpoint)
+        if args.resume:
+            print(f'Wrote {aggregate_stats["total_paragraphs"]} paragraphs.', end=' ')
+        else:
+            last_written_paragraph_index = aggregate_stats["total_paragraphs"] + args.skip
+            print(f'Last paragraph written was the {ordinal(last_written_paragraph_index)}.', end=' ')
+        print('Use --resume to continue from there.\n' if resume_key else '\n')
     else:
         print('No paragraphs written.\n')
+    if history_in_use:
+        print("This session's keystrokes were not kept in the history, as another TypeTrain session was writing them.\n")
+
+    # Keep the session in the history's daily rollups, and sum up the week
+    if not args.no_history and aggregate_stats["total_paragraphs"] > 0:
+        add_to_daily_rollup(aggregator)
+        week_stats = recent_rollup(WEEK_DAYS).stats()
+        print(
+            f'Last {WEEK_DAYS} days: {week_stats["total_paragraphs"]} paragraphs, '
+            f'median {week_stats["median_wpm"]:.0f} WPM and {week_stats["median_accuracy"]:.1f}% accuracy, '
+            f'longest streak of {week_stats["longest_streak"]} correct paragraphs.\n'
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+from parallel import batches, map_batches
+from sanitize import SANITIZER_VERSION, SanitizedText, sanitize_text
+from storage import atomic_write, storage_path
+
+
+# On-disk cache of the paragraphs of source files, already split and
+# sanitized, so large corpora are only processed once.
+#
+# The paragraphs of each file go to a pack named after the hash of the file's
+# contents, how it was split and the sanitizer version, so it's shared by any
+# copy of the file and never stale. To avoid hashing the files on every run,
+# their hashes are remembered along with their size and mtime.
+#
+# A pack is built while its paragraphs are first read, so they come as soon
+# as they're sanitized, and only kept once the whole file has been read
+# through it. The cache is kept under CACHE_MAX_BYTES by removing the least
+# recently used packs, and files bigger than that aren't cached at all.
+#
+# A pack is a header, the paragraphs as length-prefixed UTF-8 records, and a
+# table with the offset of each record plus the offset in the source file
+# right after its paragraph (to resume from source positions). Packs are
+# memory-mapped, so opening one takes no time regardless of its size.
+
+CACHE_DIR = os.path.join('cache', 'paragraphs')
+HASHES_FILE = os.path.join(CACHE_DIR, 'hashes.json')
+
+PACK_MAGIC = b'TTPACK01'
+PACK_HEADER = struct.Struct('<8sQQ')
+RECORD_LENGTH = struct.Struct('<I')
+
+# Paragraphs are sanitized in batches this big, by a pool of processes (one
+# per CPU) for files big enough to be worth starting it
+BATCH_SIZE = 2_000
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Files whose hash is remembered, at most (the most recently used ones)
+MAX_FILE_HASHES = 10_000
+
+# Packs being built, so threads needing the same one at once (e.g. server
+# sessions starting together on a fresh corpus) build it only once. The rest
+# read the file as if it wasn't cached meanwhile
+_packs_being_built = set()
+_packs_being_built_lock = threading.Lock()
+
+
+# Yields the sanitized paragraphs of the file as (paragraph, source offset
+# right after it) pairs, from the first one ending after `offset`. The pack is
+# built from `read_paragraphs(offset)`, which must yield the raw paragraphs of
+# the file from that offset in the same way (and is also used when the file
+# isn't cached). `kind` tells apart different ways of splitting the same file,
+# and `hashes` are the `FileHashes` to find the pack with. Paragraphs from the
+# pack come marked as sanitized, so they aren't sanitized again when shown
+def cached_paragraphs(path, kind, read_paragraphs, hashes, offset=0):
+    if os.path.getsize(path) > CACHE_MAX_BYTES:
+        yield from read_paragraphs(offset)
+        return
+
+    pack_path = storage_path(CACHE_DIR, f'{hashes.file_hash(path)}-{kind}-v{SANITIZER_VERSION}.pack')
+    if os.path.exists(pack_path):
+        yield from _pack_paragraphs(pack_path, offset)
+        return
+
+    with _packs_being_built_lock:
+        being_built = pack_path in _packs_being_built
+        _packs_being_built.add(pack_path)
+    if being_built:
+        yield from read_paragraphs(offset)
+        return
+
+    try:
+        workers = (os.cpu_count() or 1) if os.path.getsize(path) >= PARALLEL_MIN_BYTES else 1
+        yield from _build_pack(pack_path, read_paragraphs(), workers, offset)
+    finally:
+        with _packs_being_built_lock:
+            _packs_being_built.discard(pack_path)
+    _evict_packs(pack_path)
+
+
+def _pack_paragraphs(pack_path, offset):
+    # Marks the pack as recently used, for eviction
+    try:
+        os.utime(pack_path)
+    except OSError:
+        pass
+
+    with open(pack_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pack:
+        _, count, table_offset = PACK_HEADER.unpack_from(pack)
+        table = memoryview(pack)[table_offset:table_offset + 16 * count].cast('Q')
+        try:
+            record_offsets, source_offsets = table[:count], table[count:]
+            for idx in range(bisect.bisect_right(source_offsets, offset), count):
+                record_offset = record_offsets[idx]
+                length, = RECORD_LENGTH.unpack_from(pack, record_offset)
+                start = record_offset + RECORD_LENGTH.size
+                yield SanitizedText(pack[start:start + length].decode('utf-8')), source_offsets[idx]
+        finally:
+            # Views on the map must go before it's closed
+            record_offsets.release()
+            source_offsets.release()
+            table.release()
+
+
+# SHA-256 of the contents of files, remembered while their size and mtime
+# don't change. Loaded once for all the files of a corpus, and saved (if any
+# was hashed) once done with them
+class FileHashes:
+
+    def __init__(self):
+        try:
+            with open(storage_path(HASHES_FILE), 'r') as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = {}
+        self.changed = False
+
+
+    # Hashes are kept from the least to the most recently used
+    def file_hash(self, path):
+        abs_path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.hashes.pop(abs_path, None)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            self.hashes[abs_path] = cached
+            return cached['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                sha256.update(chunk)
+        self.hashes[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+        self.changed = True
+        return self.hashes[abs_path]['sha256']
+
+
+    def save(self):
+        if not self.changed:
+            return
+        for abs_path in list(self.hashes)[:-MAX_FILE_HASHES]:
+            del self.hashes[abs_path]
+        try:
+            with atomic_write(storage_path(HASHES_FILE)) as f:
+                json.dump(self.hashes, f, indent=2)
+            self.changed = False
+        except OSError:
+            pass
+
+
+# Writes the pack while the paragraphs are read and sanitized, so only a few
+# batches of them are in memory at a time (besides the offset table), and
+# yields them as written, from the first one ending after `offset`. If not
+# read to the end, the pack is dropped
+def _build_pack(pack_path, paragraphs, workers, offset):
+    record_offsets = array('Q')
+    source_offsets = array('Q')
+
+    with atomic_write(pack_path, 'wb') as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, 0, 0))
+        for batch, sanitized_batch in map_batches(_sanitize_all, batches(paragraphs, BATCH_SIZE), workers):
+            for (_, source_offset), paragraph in zip(batch, sanitized_batch):
+                if not paragraph.strip():
+                    continue
+                data = paragraph.encode('utf-8')
+                record_offsets.append(f.tell())
+                source_offsets.append(source_offset)
+                f.write(RECORD_LENGTH.pack(len(data)))
+                f.write(data)
+                if source_offset > offset:
+                    yield SanitizedText(paragraph), source_offset
+
+        # Padding so the table can be read in place as 8 byte integers
+        f.write(bytes(-f.tell() % 8))
+        table_offset = f.tell()
+        record_offsets.tofile(f)
+        source_offsets.tofile(f)
+        f.seek(0)
+        f.write(PACK_HEADER.pack(PACK_MAGIC, len(record_offsets), table_offset))
+
+
+# Removes the least recently used packs (but the given one) while the cache is
+# bigger than CACHE_MAX_BYTES
+def _evict_packs(keep_path):
+    cache_dir = os.path.dirname(keep_path)
+    packs = []
+    for file_name in os.listdir(cache_dir):
+        if not file_name.endswith('.pack'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, file_name))
+        except OSError:
+            continue
+        packs.append((stat.st_mtime_ns, stat.st_size, os.path.join(cache_dir, file_name)))
+
+    total_size = sum(size for _, size, _ in packs)
+    for _, size, path in sorted(packs):
+        if total_size <= CACHE_MAX_BYTES:
+            break
+        if path == keep_path:
+            continue
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError:
+            pass
+
+
+# Sanitized paragraphs of a batch of (paragraph, source offset) pairs
+def _sanitize_all(batch):
+    return [sanitize_text(paragraph) for paragraph, _ in batch]
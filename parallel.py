@@ -0,0 +1,39 @@
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Splits the items in lists of up to `size` of them, as they come
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Yields (batch, function(batch)) pairs, in order. Runs in this process if
+# `workers` is 1, and on a pool of that many processes otherwise, with only a
+# few batches in flight at a time (so the batches can keep streaming in). The
+# function must be importable by the workers: defined at the top of a module
+def map_batches(function, batches, workers):
+    if workers == 1:
+        for batch in batches:
+            yield batch, function(batch)
+        return
+
+    # Spawned rather than forked, to be safe with whatever threads the caller
+    # has running
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(function, batch)))
+            if len(pending) >= 2 * workers:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
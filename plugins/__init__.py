@@ -1,14 +1,183 @@
-# Pardon this abomination xD
+import ast
+import importlib
+import json
+import os
+import sys
+
+from storage import atomic_write, storage_path
+
+
+# Third party plugins register a `name = package.module:PluginClass` entry
+# point in this group
+ENTRY_POINT_GROUP = 'typetrain.plugins'
+
+# Cached name, description and location of every plugin, so listing them
+# (e.g. to build the CLI) doesn't import any. Entries for bundled plugins are
+# invalidated by the mtime of their module. Entry points are only looked up
+# again (which is slow) when a directory in `sys.path` changes, as happens
+# when packages are installed or removed, and their entries are invalidated by
+# the version of the distribution providing them
+MANIFEST_CACHE_FILE = os.path.join('cache', 'plugins.json')
+MANIFEST_CACHE_VERSION = 1
+EMPTY_MANIFEST_CACHE = {'version': MANIFEST_CACHE_VERSION, 'modules': {}, 'sys_path': None, 'entry_points': {}}
+
+PLUGINS_PATH = os.path.dirname(__file__)
+
+
+def modulename_to_classname(modulename):
+    return "".join(c.capitalize() for c in modulename.lower().split("_"))
+
+
+# Returns {one_word_name: {'description', 'module', 'class'}} for all plugins,
+# without importing them (but the first time a third party one is seen)
+def get_plugin_manifest():
+    cache = _load_manifest_cache()
+    new_cache = dict(EMPTY_MANIFEST_CACHE, modules={}, sys_path=_sys_path_signature(), entry_points={})
+    manifest = {}
+
+    # Bundled plugins: one per module, the class named after it. Modules
+    # starting with an underscore are helpers, not plugins
+    for plugin_file in sorted(os.listdir(PLUGINS_PATH)):
+        if not plugin_file.endswith('.py') or plugin_file.startswith('_'):
+            continue
+        mtime_ns = os.stat(os.path.join(PLUGINS_PATH, plugin_file)).st_mtime_ns
+        cached = cache['modules'].get(plugin_file)
+        if cached is None or cached['mtime_ns'] != mtime_ns:
+            cached = {'mtime_ns': mtime_ns, 'plugin': _read_bundled_plugin_info(plugin_file)}
+        new_cache['modules'][plugin_file] = cached
+        if cached['plugin']:
+            manifest[cached['plugin']['name']] = cached['plugin']
+
+    # Third party plugins, from entry points
+    if new_cache['sys_path'] == cache['sys_path']:
+        new_cache['entry_points'] = cache['entry_points']
+    else:
+        from importlib import metadata
+        for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+            version = entry_point.dist.version if entry_point.dist else None
+            cached = cache['entry_points'].get(entry_point.value)
+            if cached is None or cached['version'] != version:
+                cached = {'version': version, 'plugin': _read_entry_point_plugin_info(entry_point)}
+            new_cache['entry_points'][entry_point.value] = cached
+    for cached in new_cache['entry_points'].values():
+        manifest.setdefault(cached['plugin']['name'], cached['plugin'])
+
+    if new_cache != cache:
+        _save_manifest_cache(new_cache)
+
+    return manifest
+
+
+def load_plugin(name):
+    plugin = get_plugin_manifest()[name]
+    return getattr(importlib.import_module(plugin['module']), plugin['class'])
+
+
 def get_plugins():
-    import importlib
-    import os
-
-    def modulename_to_classname(modulename):
-        return "".join(c.capitalize() for c in modulename.lower().split("_"))
-    
-    plugins_path = os.path.dirname(__file__)
-    plugin_files = [f for f in os.listdir(plugins_path) if f.endswith('.py') and f != '__init__.py']
-    plugin_modules = [importlib.import_module(f'plugins.{plugin_file[:-3]}') for plugin_file in plugin_files]
-    plugins_classes = [getattr(p, modulename_to_classname(p.__name__.split('.')[-1])) for p in plugin_modules]
-    
-    return plugins_classes
+    return [load_plugin(name) for name in get_plugin_manifest()]
+
+
+# Reads the plugin's name and description from the source of its module,
+# which is way cheaper than importing it (and its dependencies)
+def _read_bundled_plugin_info(plugin_file):
+    module_name = plugin_file[:-3]
+    class_name = modulename_to_classname(module_name)
+
+    with open(os.path.join(PLUGINS_PATH, plugin_file), 'r') as f:
+        module_ast = ast.parse(f.read(), plugin_file)
+
+    for node in module_ast.body:
+        if isinstance(node, ast.ClassDef) and node.name == class_name:
+            attributes = {
+                target.id: statement.value.value
+                for statement in node.body if isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant)
+                for target in statement.targets if isinstance(target, ast.Name)
+            }
+            if 'one_word_name' in attributes:
+                return {
+                    'name': attributes['one_word_name'],
+                    'description': attributes.get('description'),
+                    'module': f'{__name__}.{module_name}',
+                    'class': class_name,
+                }
+    return None
+
+
+def _read_entry_point_plugin_info(entry_point):
+    plugin_class = entry_point.load()
+    return {
+        'name': entry_point.name,
+        'description': getattr(plugin_class, 'description', None),
+        'module': entry_point.module,
+        'class': entry_point.attr,
+    }
+
+
+def _load_manifest_cache():
+    try:
+        with open(storage_path(MANIFEST_CACHE_FILE), 'r') as f:
+            cache = json.load(f)
+        if cache.get('version') == MANIFEST_CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return EMPTY_MANIFEST_CACHE
+
+
+# The first entry is the directory of the running script, not where packages go
+def _sys_path_signature():
+    return [[path, os.stat(path).st_mtime_ns] for path in sys.path[1:] if os.path.isdir(path)]
+
+
+def _save_manifest_cache(cache):
+    try:
+        with atomic_write(storage_path(MANIFEST_CACHE_FILE)) as f:
+            json.dump(cache, f, indent=2)
+    except OSError:
+        pass
+
+
+# Resuming a source without `paragraphs_from` means pulling all the paragraphs
+# to skip again, and some never end, so only this many can be skipped
+MAX_SKIPPED_PARAGRAPHS = 100_000
+
+
+# Plugins yield paragraphs through `paragraph_generator()`. Those that can seek
+# in their source also implement `paragraphs_from(checkpoint)`, yielding each
+# paragraph along with an opaque (JSON serializable) checkpoint to resume right
+# after it, and a `resume_key` identifying the source. For the rest, the
+# checkpoint is just the number of paragraphs consumed, and resuming means
+# pulling that many paragraphs again.
+def paragraphs_with_checkpoints(plugin, checkpoint=None):
+    if hasattr(plugin, 'paragraphs_from'):
+        yield from plugin.paragraphs_from(checkpoint)
+        return
+
+    paragraphs_to_skip = checkpoint or 0
+    for paragraphs_consumed, paragraph in enumerate(plugin.paragraph_generator(), start=1):
+        if paragraphs_consumed > paragraphs_to_skip:
+            yield paragraph, paragraphs_consumed
+
+
+# Whether the checkpoint is one to resume the plugin from, for checkpoints that
+# can't be trusted (e.g. sent by a remote client). Plugins with
+# `paragraphs_from` check their own by implementing
+# `is_valid_checkpoint(checkpoint)` (any is taken otherwise)
+def is_valid_checkpoint(plugin, checkpoint):
+    if checkpoint is None:
+        return True
+    if hasattr(plugin, 'paragraphs_from'):
+        return not hasattr(plugin, 'is_valid_checkpoint') or plugin.is_valid_checkpoint(checkpoint)
+    return type(checkpoint) == int and 0 <= checkpoint <= MAX_SKIPPED_PARAGRAPHS
+
+
+# Plugins whose paragraphs come from slow I/O (e.g. the network) can implement
+# `async_paragraph_generator()` instead: an async generator, run on the app's
+# event loop. Checkpoints are paragraph counts, as above
+async def async_paragraphs_with_checkpoints(plugin, checkpoint=None):
+    paragraphs_to_skip = checkpoint or 0
+    paragraphs_consumed = 0
+    async for paragraph in plugin.async_paragraph_generator():
+        paragraphs_consumed += 1
+        if paragraphs_consumed > paragraphs_to_skip:
+            yield paragraph, paragraphs_consumed
@@ -0,0 +1,154 @@
+import bz2
+import glob
+import gzip
+import lzma
+import os
+import random
+
+from paragraph_cache import FileHashes, cached_paragraphs
+
+
+# Streaming access to text corpora for the file based plugins. A corpus is a
+# single file, a directory (walked recursively) or a glob pattern, and its
+# files can be compressed with gzip, bzip2 or xz (told by their extension).
+# Files are decompressed incrementally as they are read, so memory use doesn't
+# depend on their size.
+#
+# Positions in a corpus are [file index, offset] pairs, the offset being in
+# the decompressed contents of the file. Seeking in a compressed file means
+# decompressing everything up to there: resuming deep into one takes a while,
+# but no extra memory.
+#
+# Plugins read corpora as paragraphs, split out of each file by a splitter: a
+# function yielding the paragraphs (as text) in a file opened in binary mode,
+# each along with the offset right after it. Paragraphs don't span files.
+# Optionally, the paragraphs of each file are sanitized and cached on the first
+# run (see `paragraph_cache`), except for compressed files: they'd take their
+# decompressed size on disk.
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+}
+
+# Files left out of directories and glob matches, besides hidden ones:
+# RandomFile's offset indexes
+IGNORED_SUFFIXES = ('.idx',)
+
+# Paragraphs held at a time by `buffered_shuffle`
+SHUFFLE_BUFFER_SIZE = 10_000
+
+
+# Paths of the files in the corpus, in a stable order. Empty if there are none
+def corpus_files(path):
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return _walk(path)
+
+    files = []
+    for match in sorted(glob.glob(path, recursive=True)):
+        if os.path.isdir(match):
+            files += _walk(match)
+        elif not _is_ignored(os.path.basename(match)):
+            files.append(match)
+    return files
+
+
+def is_compressed(path):
+    return _extension(path) in OPENERS
+
+
+# Opens the file for reading in binary mode, decompressing on the fly if needed
+def open_corpus_file(path):
+    return OPENERS.get(_extension(path), open)(path, 'rb')
+
+
+# Yields the paragraphs of the files, as split by `split`, along with the
+# position right after each one, starting at the given position
+def corpus_paragraphs(files, split, position=None, cache=False):
+    first_file_idx, offset = _unpack_position(position)
+    hashes = FileHashes() if cache else None
+    try:
+        for file_idx in range(first_file_idx, len(files)):
+            if cache and not is_compressed(files[file_idx]):
+                paragraphs = cached_paragraphs(files[file_idx], split.__name__, lambda offset=0: file_paragraphs(files[file_idx], split, offset), hashes, offset)
+            else:
+                paragraphs = file_paragraphs(files[file_idx], split, offset)
+            for paragraph, end_offset in paragraphs:
+                yield paragraph, [file_idx, end_offset]
+            offset = 0
+    finally:
+        if hashes:
+            hashes.save()
+
+
+def file_paragraphs(path, split, offset=0):
+    with open_corpus_file(path) as f:
+        if offset:
+            f.seek(offset)
+        yield from split(f)
+
+
+# Splitter for a paragraph per line (newline included)
+def split_lines(f):
+    while line := f.readline():
+        yield line.decode('utf-8'), f.tell()
+
+
+# Splitter for the whole file as a single paragraph
+def split_whole(f):
+    if document := f.read():
+        yield document.decode('utf-8'), f.tell()
+
+
+# Yields the items in random order, holding at most `size` of them at a time.
+# Not a uniform shuffle (items can't move back more than `size` places), but
+# good enough for sources much bigger than the buffer
+def buffered_shuffle(items, size=SHUFFLE_BUFFER_SIZE):
+    buffer = []
+    for item in items:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        idx = random.randrange(size)
+        yield buffer[idx]
+        buffer[idx] = item
+    random.shuffle(buffer)
+    yield from buffer
+
+
+def _walk(directory):
+    files = []
+    for dir_path, dir_names, file_names in os.walk(directory):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith('.'))
+        files += [os.path.join(dir_path, file_name) for file_name in sorted(file_names) if not _is_ignored(file_name)]
+    return files
+
+
+def _is_ignored(file_name):
+    return file_name.startswith('.') or file_name.endswith(IGNORED_SUFFIXES)
+
+
+def _extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+# Whether it's a position `corpus_paragraphs` can start from: an offset, or a
+# [file index, offset] pair
+def is_valid_position(position):
+    if type(position) == int:
+        return position >= 0
+    return type(position) in (list, tuple) and len(position) == 2 and all(type(part) == int and part >= 0 for part in position)
+
+
+# Positions saved before corpora could have several files are plain offsets in
+# the (only) file
+def _unpack_position(position):
+    if position is None:
+        return 0, 0
+    if isinstance(position, int):
+        return 0, position
+    return position
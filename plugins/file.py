@@ -1,5 +1,7 @@
 import os
 
+from ._corpus import corpus_files, corpus_paragraphs, is_valid_position, split_lines, split_whole
+
 
 class File:
     one_word_name = 'file'
@@ -7,15 +9,31 @@ class File:
 
     def __init__(self, args):
         self.path = args.path
+        self.whole = args.whole
+        self.cache = args.cache
 
     @staticmethod
     def configure_argparse_subparser(parser):
-        parser.add_argument('path', help='path to the file to practice typing')
+        parser.add_argument('path', help='path to the file to practice typing. Can also be a directory or a glob pattern, and files can be compressed (.gz, .bz2, .xz)')
+        parser.add_argument('--whole', action='store_true', help='practice each whole file as a single exercise (e.g. a chapter)')
+        parser.add_argument('--cache', action='store_true', help='cache the sanitized paragraphs of the files, for faster loading the next time (but for compressed files)')
+
+    @property
+    def resume_key(self):
+        return f'{self.one_word_name}:{os.path.abspath(self.path)}'
 
     def paragraph_generator(self):
-        if not os.path.exists(self.path):
+        for paragraph, _ in self.paragraphs_from(None):
+            yield paragraph
+
+    # Checkpoints are positions in the corpus (see `_corpus`), right after
+    # each paragraph
+    def paragraphs_from(self, checkpoint):
+        files = corpus_files(self.path)
+        if not files:
             exit(f'File {self.path} does not exist')
 
-        with open(self.path, 'r') as f:
-            while paragraph := f.readline():
-                yield paragraph
+        yield from corpus_paragraphs(files, split_whole if self.whole else split_lines, checkpoint, self.cache)
+
+    def is_valid_checkpoint(self, checkpoint):
+        return is_valid_position(checkpoint)
@@ -1,24 +1,128 @@
+import mmap
 import os
 import random
+import struct
+import threading
+from array import array
+
+from storage import atomic_write
+
+from ._corpus import buffered_shuffle, corpus_files, corpus_paragraphs, is_compressed, split_lines
 
 
 class RandomFile:
     one_word_name = 'random-file'
     description = 'practice typing random paragraphs in a file'
 
+    # Sidecar index of line offsets, stored next to the file as `<path>.idx`.
+    # The header records the size and mtime of the file it was built for
+    INDEX_SUFFIX = '.idx'
+    INDEX_MAGIC = b'TTIDX001'
+    INDEX_HEADER = struct.Struct('<8sQQ')
+
     def __init__(self, args):
         self.path = args.path
+        self.indexed = args.indexed
+        self._paragraphs = None
+        self._paragraphs_lock = threading.Lock()
 
     @staticmethod
     def configure_argparse_subparser(parser):
-        parser.add_argument('path', help='path to the file to practice typing')
+        parser.add_argument('path', help='path to the file to practice typing. Can also be a directory or a glob pattern, and files can be compressed (.gz, .bz2, .xz)')
+        parser.add_argument('--indexed', action='store_true', help='memory-map the file and sample paragraphs through an offset index (for huge files)')
 
     def paragraph_generator(self):
-        if not os.path.exists(self.path):
+        files = corpus_files(self.path)
+        if not files:
             exit(f'File {self.path} does not exist')
-            
-        with open(self.path, 'r') as f:
-            paragraphs = f.read().split('\n')
-            random.shuffle(paragraphs)
-            for paragraph in paragraphs:
-                yield paragraph
+
+        # Compressed or multi-file corpora are streamed, so only a bounded
+        # buffer of them is shuffled at a time
+        if len(files) > 1 or is_compressed(files[0]):
+            if self.indexed:
+                exit('--indexed needs a single uncompressed file')
+            random.shuffle(files)
+            yield from buffered_shuffle(line.rstrip('\n') for line, _ in corpus_paragraphs(files, split_lines))
+            return
+
+        if self.indexed:
+            yield from self._indexed_paragraph_generator(files[0])
+            return
+
+        paragraphs = self._load_paragraphs(files[0])
+        for paragraph_idx in self._lazy_shuffle(len(paragraphs)):
+            yield paragraphs[paragraph_idx]
+
+    # The file is read once, and its paragraphs shared by all the generators
+    # (e.g. the sessions of a server), each drawing them in its own order
+    def _load_paragraphs(self, path):
+        with self._paragraphs_lock:
+            if self._paragraphs is None:
+                with open(path, 'r') as f:
+                    self._paragraphs = f.read().split('\n')
+            return self._paragraphs
+
+    # Neither startup time nor memory depend on the size of the file: it is
+    # mapped instead of read, and paragraphs are located through the persisted
+    # offset index and drawn one at a time
+    def _indexed_paragraph_generator(self, path):
+        if os.path.getsize(path) == 0:
+            return
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+            line_offsets = self._load_or_build_index(path, text)
+            try:
+                for line_idx in self._lazy_shuffle(len(line_offsets) - 1):
+                    line = text[line_offsets[line_idx]:line_offsets[line_idx + 1] - 1]
+                    yield line.decode('utf-8')
+            finally:
+                # Views on the index's map must go before it's closed
+                if isinstance(line_offsets, memoryview):
+                    line_offsets.release()
+
+    # Offset where each line starts, followed by the size of the file plus one
+    # (as if it ended with a newline), so line i is [offsets[i], offsets[i+1] - 1)
+    def _load_or_build_index(self, path, text):
+        index_path = path + self.INDEX_SUFFIX
+        source_stat = os.stat(path)
+
+        try:
+            with open(index_path, 'rb') as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, size, mtime_ns = self.INDEX_HEADER.unpack_from(index)
+            if (magic, size, mtime_ns) == (self.INDEX_MAGIC, source_stat.st_size, source_stat.st_mtime_ns):
+                return memoryview(index)[self.INDEX_HEADER.size:].cast('Q')
+            index.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+        line_offsets = array('Q', [0])
+        position = 0
+        while (position := text.find(b'\n', position)) != -1:
+            position += 1
+            line_offsets.append(position)
+        if line_offsets[-1] != len(text):
+            line_offsets.append(len(text) + 1)
+
+        # Persist it for the next time. Not being able to (e.g. read-only
+        # directory) just means building it again
+        try:
+            with atomic_write(index_path, 'wb') as f:
+                f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, source_stat.st_size, source_stat.st_mtime_ns))
+                line_offsets.tofile(f)
+        except OSError:
+            pass
+
+        return line_offsets
+
+    # Fisher-Yates shuffle of range(n) that is consumed lazily and only keeps
+    # track of the positions that have been swapped so far
+    @staticmethod
+    def _lazy_shuffle(n):
+        swapped = {}
+        for i in range(n - 1, -1, -1):
+            j = random.randint(0, i)
+            yield swapped.get(j, j)
+            if j != i:
+                swapped[j] = swapped.get(i, i)
+            swapped.pop(i, None)
@@ -1,11 +1,24 @@
 import random
 import string
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Serials:
     one_word_name = 'serials'
     description = 'practice typing random serial numbers'
 
+    # Characters in serials: 20% chance of an uppercase letter or a dot, 80% of
+    # a digit. There's a dash in the middle
+    SERIAL_CHARS = string.ascii_uppercase + '.' + string.digits
+    SERIAL_CHAR_WEIGHTS = [0.2 / 27] * 27 + [0.8 / 10] * 10
+
+    # Paragraphs are generated this many at a time
+    BATCH_SIZE = 256
+
     def __init__(self, args):
         self.num_words_per_paragraph = args.num
         self.num_chars_per_gen_word = args.chars
@@ -20,31 +33,51 @@ class Serials:
 
     def paragraph_generator(self):
         while True:
-            paragraph = ''
-            for i in range(self.num_words_per_paragraph):
-                if i % 2 == 1 and self.words_file_path:
-                    paragraph += self._word_from_file()
-                else:
-                    paragraph += self._generate_serial_number()
-                paragraph += ' '
-            paragraph = paragraph[:-1]
-            yield paragraph
-
-    def _word_from_file(self):
+            yield from self.generate_paragraphs(self.BATCH_SIZE)
+
+    # Bulk API, also usable to pre-generate drill files offline
+    def generate_paragraphs(self, count):
+        num_words = self.num_words_per_paragraph
+        intercalate_words = bool(self.words_file_path)
+
+        # Odd positions hold words from the file, if any
+        num_serials_per_paragraph = (num_words + 1) // 2 if intercalate_words else num_words
+        serials = iter(self.generate_serials(count * num_serials_per_paragraph, self.num_chars_per_gen_word))
+        words = iter(self._words_from_file(count * (num_words - num_serials_per_paragraph)))
+
+        return [
+            ' '.join(next(words) if i % 2 == 1 and intercalate_words else next(serials) for i in range(num_words))
+            for _ in range(count)
+        ]
+
+    @classmethod
+    def generate_serials(cls, count, num_chars):
+        # All the random characters are drawn at once, and then cut into serials
+        # with the dash inserted in the middle
+        dash_idx = num_chars // 2
+        num_random_chars = max(0, num_chars - 1)
+        if count == 0 or num_chars == 0:
+            return [''] * count
+
+        if numpy is not None:
+            chars = numpy.frombuffer(cls.SERIAL_CHARS.encode('ascii'), dtype=numpy.uint8)
+            weights = numpy.array(cls.SERIAL_CHAR_WEIGHTS)
+            drawn = numpy.random.default_rng().choice(chars, size=(count, num_random_chars), p=weights / weights.sum())
+            dashes = numpy.full((count, 1), ord('-'), dtype=numpy.uint8)
+            all_chars = numpy.hstack((drawn[:, :dash_idx], dashes, drawn[:, dash_idx:])).tobytes().decode('ascii')
+        else:
+            drawn = ''.join(random.choices(cls.SERIAL_CHARS, weights=cls.SERIAL_CHAR_WEIGHTS, k=count * num_random_chars))
+            all_chars = ''.join(
+                drawn[i:i + dash_idx] + '-' + drawn[i + dash_idx:i + num_random_chars]
+                for i in range(0, len(drawn), num_random_chars)
+            ) if num_random_chars > 0 else '-' * count
+
+        return [all_chars[i:i + num_chars] for i in range(0, count * num_chars, num_chars)]
+
+    def _words_from_file(self, count):
+        if count == 0:
+            return []
         if not self.words_from_file:
             with open(self.words_file_path, 'r') as f:
                 self.words_from_file = [w.strip() for w in f.read().splitlines() if len(w.strip()) > 0]
-        return random.choice(self.words_from_file)
-
-    def _generate_serial_number(self):
-        serial_number = ''
-        for i in range(self.num_chars_per_gen_word):
-            if i == int(self.num_chars_per_gen_word / 2):
-                serial_number += '-'
-                continue
-            r = random.randint(0, 9)
-            if r < 2:
-                serial_number += random.choice(string.ascii_uppercase + '.')
-            else:
-                serial_number += str(random.randint(0, 9))
-        return serial_number
+        return random.choices(self.words_from_file, k=count)
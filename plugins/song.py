@@ -1,5 +1,7 @@
 import os
 
+from ._corpus import corpus_files, corpus_paragraphs, is_valid_position
+
 
 class Song:
     one_word_name = 'song'
@@ -7,25 +9,45 @@ class Song:
 
     def __init__(self, args):
         self.path = args.path
+        self.cache = args.cache
 
     @staticmethod
     def configure_argparse_subparser(parser):
-        parser.add_argument('path', help='path to the file to practice typing')
+        parser.add_argument('path', help='path to the file to practice typing. Can also be a directory or a glob pattern, and files can be compressed (.gz, .bz2, .xz)')
+        parser.add_argument('--cache', action='store_true', help='cache the sanitized stanzas of the files, for faster loading the next time (but for compressed files)')
+
+    @property
+    def resume_key(self):
+        return f'{self.one_word_name}:{os.path.abspath(self.path)}'
 
     def paragraph_generator(self):
-        if not os.path.exists(self.path):
+        for paragraph, _ in self.paragraphs_from(None):
+            yield paragraph
+
+    # Checkpoints are positions in the corpus (see `_corpus`), right after
+    # each stanza
+    def paragraphs_from(self, checkpoint):
+        files = corpus_files(self.path)
+        if not files:
             exit(f'File {self.path} does not exist')
 
-        with open(self.path, 'r') as f:
-            contiguous_lines = []
-            while line := f.readline():
-                line = line.strip()
-                if line:
-                    contiguous_lines.append(line)
-                elif contiguous_lines:
-                    yield "\n".join(contiguous_lines)
-                    contiguous_lines = []
-                else:
-                    continue
-            if contiguous_lines:
-                yield "\n".join(contiguous_lines)
+        yield from corpus_paragraphs(files, self.split_stanzas, checkpoint, self.cache)
+
+    def is_valid_checkpoint(self, checkpoint):
+        return is_valid_position(checkpoint)
+
+    # Corpus splitter for stanzas: runs of contiguous non-blank lines
+    @staticmethod
+    def split_stanzas(f):
+        contiguous_lines = []
+        while line := f.readline():
+            line = line.decode('utf-8').strip()
+            if line:
+                contiguous_lines.append(line)
+            elif contiguous_lines:
+                yield "\n".join(contiguous_lines), f.tell()
+                contiguous_lines = []
+            else:
+                continue
+        if contiguous_lines:
+            yield "\n".join(contiguous_lines), f.tell()
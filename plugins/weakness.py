@@ -0,0 +1,115 @@
+import os
+import random
+import time
+from array import array
+from collections import defaultdict
+
+from analytics import KeystrokeSamples, latency_tables
+from keylog import KeystrokeLog
+
+
+class Weakness:
+    one_word_name = 'weakness'
+    description = 'practice words targeting your slowest and most error-prone characters and bigrams'
+
+    # N-grams need this many attempts in the history to be judged
+    MIN_ATTEMPTS = 5
+
+    # How much a 100% error rate weighs compared to being twice as slow as the
+    # average
+    ERROR_WEIGHT = 2
+
+    def __init__(self, args):
+        self.num_words_per_paragraph = args.num
+
+        # Inverted index from every character and bigram to the words
+        # containing it
+        if not os.path.exists(args.words_file):
+            exit(f'File {args.words_file} does not exist')
+        with open(args.words_file, 'r') as f:
+            self.words = [w.strip() for w in f.read().splitlines() if len(w.strip()) > 0]
+        if not self.words:
+            exit(f'File {args.words_file} has no words')
+        self.words_by_ngram = defaultdict(lambda: array('I'))
+        for word_idx, word in enumerate(self.words):
+            for ngram in set(word) | {word[i:i + 2] for i in range(len(word) - 1)}:
+                self.words_by_ngram[ngram].append(word_idx)
+
+        # The weakest n-grams in the history, to pick from weighted by how weak
+        # they are. Without history to go by (or to use, with --no-history),
+        # all characters are picked alike
+        weights_by_ngram = {}
+        if not getattr(args, 'no_history', False):
+            weights_by_ngram = self._weakest_ngrams(args.targets, time.time() - args.days * 24 * 60 * 60)
+        if not weights_by_ngram:
+            weights_by_ngram = {ngram: 1 for ngram in self.words_by_ngram if len(ngram) == 1}
+        self.target_ngrams = list(weights_by_ngram)
+        self.target_sampler = AliasSampler(list(weights_by_ngram.values()))
+
+    @staticmethod
+    def configure_argparse_subparser(parser):
+        parser.add_argument('words_file', help='path to a file containing the words to practice with, one per line')
+        parser.add_argument('--num', type=int, default=12, help='number of words per paragraph')
+        parser.add_argument('--targets', type=int, default=20, help='number of weak characters/bigrams to target')
+        parser.add_argument('--days', type=float, default=30, help='days of training history to look for weaknesses in')
+
+    def paragraph_generator(self):
+        while True:
+            yield ' '.join(self._word() for _ in range(self.num_words_per_paragraph))
+
+    def _word(self):
+        candidates = self.words_by_ngram[self.target_ngrams[self.target_sampler.sample()]]
+        return self.words[candidates[random.randrange(len(candidates))]]
+
+    # Scores each n-gram by its latency relative to the average, plus its error
+    # rate. Returns the weakest ones (that can be found in the words) with
+    # their scores
+    def _weakest_ngrams(self, count, since):
+        samples = KeystrokeSamples()
+        try:
+            with KeystrokeLog(read_only=True) as keylog:
+                samples.add_records(keylog.records(since))
+        except FileNotFoundError:
+            return {}
+        tables = latency_tables(samples)
+
+        rows = [
+            (ngram, row)
+            for table in tables.values() for ngram, row in table.items()
+            if row['attempts'] >= self.MIN_ATTEMPTS and ngram in self.words_by_ngram
+        ]
+        latencies = [row['mean_latency_s'] for _, row in rows if row['mean_latency_s'] is not None]
+        if not latencies:
+            return {}
+        average_latency = sum(latencies) / len(latencies)
+
+        scores = {
+            ngram: (row['mean_latency_s'] or average_latency) / average_latency + self.ERROR_WEIGHT * row['error_rate']
+            for ngram, row in rows
+        }
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:count])
+
+
+# Walker's alias method: after an O(n) setup, draws indexes with probability
+# proportional to the given weights in O(1)
+class AliasSampler:
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.probabilities = [1.0] * n
+        self.aliases = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.probabilities[s] = scaled[s]
+            self.aliases[s] = l
+            scaled[l] += scaled[s] - 1
+            (small if scaled[l] < 1 else large).append(l)
+
+    def sample(self):
+        i = random.randrange(len(self.probabilities))
+        return i if random.random() < self.probabilities[i] else self.aliases[i]
@@ -0,0 +1,149 @@
+import asyncio
+import queue
+import threading
+
+
+# Iterates over the results of `prepare(item)` for each item of `iterable`,
+# which are computed on a worker thread, up to `depth` items ahead of the
+# consumer. Results that are None are dropped.
+#
+# Used to fetch and prepare the next paragraphs while the user is still typing
+# the current one, so slow sources don't make the user wait between exercises.
+# Anything raised on the worker (including SystemExit) is raised again on the
+# consumer side, in order.
+class Prefetcher:
+
+    DEFAULT_DEPTH = 4
+
+    _DONE = object()
+
+    class _Failure:
+        def __init__(self, exception):
+            self.exception = exception
+
+
+    def __init__(self, iterable, prepare, depth=DEFAULT_DEPTH):
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._closed = threading.Event()
+        self._worker = threading.Thread(target=self._work, args=(iterable, prepare), name='prefetch', daemon=True)
+        self._worker.start()
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        item = self._get()
+        if item is self._DONE:
+            self._closed.set()
+            raise StopIteration
+        if isinstance(item, self._Failure):
+            self._closed.set()
+            raise item.exception
+        return item
+
+
+    def close(self):
+        self._closed.set()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+    def _work(self, iterable, prepare):
+        try:
+            for item in iterable:
+                prepared = prepare(item)
+                if prepared is not None and not self._put(prepared):
+                    return
+        except BaseException as e:
+            self._put(self._Failure(e))
+        else:
+            self._put(self._DONE)
+
+
+    # Blocks until there's an item, giving up (as if done) if closed meanwhile,
+    # maybe from another thread
+    def _get(self):
+        while not self._closed.is_set():
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._DONE
+
+
+    # Blocks while the queue is full, giving up if the consumer goes away
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+# Asynchronous counterpart of Prefetcher, for use from an asyncio event loop.
+# Regular iterables are still consumed on a worker thread (see Prefetcher),
+# without blocking the loop while waiting for results. Async iterables (e.g.
+# async generators awaiting slow I/O) are consumed by a task on the loop
+# instead.
+class AsyncPrefetcher:
+
+    def __init__(self, iterable, prepare, depth=Prefetcher.DEFAULT_DEPTH):
+        self._closed = False
+        if hasattr(iterable, '__aiter__'):
+            self._prefetcher = None
+            self._queue = asyncio.Queue(maxsize=max(1, depth))
+            self._task = asyncio.get_running_loop().create_task(self._work(iterable, prepare))
+        else:
+            self._prefetcher = Prefetcher(iterable, prepare, depth)
+            self._task = None
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+
+        if self._prefetcher is not None:
+            item = await asyncio.to_thread(next, self._prefetcher, Prefetcher._DONE)
+        else:
+            item = await self._queue.get()
+        if item is Prefetcher._DONE:
+            self._closed = True
+            raise StopAsyncIteration
+        if isinstance(item, Prefetcher._Failure):
+            self._closed = True
+            raise item.exception
+        return item
+
+
+    def close(self):
+        self._closed = True
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+        else:
+            self._task.cancel()
+
+
+    async def _work(self, aiterable, prepare):
+        try:
+            async for item in aiterable:
+                prepared = prepare(item)
+                if prepared is not None:
+                    await self._queue.put(prepared)
+        except Exception as e:
+            await self._queue.put(Prefetcher._Failure(e))
+        else:
+            await self._queue.put(Prefetcher._DONE)
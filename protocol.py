@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+
+# Wire protocol between the training server (see server.py) and its clients
+# (see client.py): JSON objects, one per line, each with a `type`.
+#
+# Server to client:
+#   {"type": "welcome", "plugin": ..., "resume_key": ...}  On connection
+#   {"type": "paragraph", "text": ..., "checkpoint": ...}
+#   {"type": "char", "idx": ..., "state": ...}  Char registered, with its state
+#   {"type": "backspace", "idx": ...}           Char deleted, cursor now there
+#   {"type": "stats", "stats": {...}}           Live stats of the paragraph
+#   {"type": "done", "stats": {...}}            Paragraph finished
+#   {"type": "end"}                             No more paragraphs
+#   {"type": "error", "message": ...}
+#
+# Client to server:
+#   {"type": "hello", "checkpoint": ...}  After the welcome. The checkpoint
+#                                          (or null) is where to start in the
+#                                          plugin's paragraphs
+#   {"type": "key", "key": "a"}           A key-press: a printable char, a
+#                                          newline or a backspace ('\x7f')
+#   {"type": "next"}                      Ready for the next paragraph
+
+# Limits for a single message, so a client can't make the server buffer
+# arbitrarily long lines. Messages from the server carry whole paragraphs
+MAX_CLIENT_MESSAGE_BYTES = 64 * 1024
+MAX_SERVER_MESSAGE_BYTES = 1024 * 1024 * 1024
+
+
+# Addresses are `host:port` (or just `:port`, meaning localhost) for TCP, and
+# `unix:path` or any path containing a slash for Unix sockets. Returns
+# ('unix', path) or ('tcp', (host, port))
+def parse_address(address):
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if '/' in address:
+        return 'unix', address
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'Invalid address {address}: expected host:port or a Unix socket path')
+    return 'tcp', (host or 'localhost', int(port))
+
+
+async def start_server(handle_connection, address):
+    kind, location = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.start_unix_server(handle_connection, location, limit=MAX_CLIENT_MESSAGE_BYTES)
+    host, port = location
+    return await asyncio.start_server(handle_connection, host, port, limit=MAX_CLIENT_MESSAGE_BYTES)
+
+
+async def open_connection(address):
+    kind, location = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.open_unix_connection(location, limit=MAX_SERVER_MESSAGE_BYTES)
+    host, port = location
+    return await asyncio.open_connection(host, port, limit=MAX_SERVER_MESSAGE_BYTES)
+
+
+def encode_message(type, **fields):
+    return json.dumps(dict(fields, type=type), separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+# Next message from the stream, or None when closed. Raises ValueError for
+# anything but a JSON object
+async def read_message(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError('Expected a JSON object')
+    return message
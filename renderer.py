@@ -0,0 +1,72 @@
+import curses
+import time
+
+from tracing import span
+
+
+# Thin layer between the exercise loop and curses. Remembers what was last
+# drawn on every cell so unchanged cells are not written again, lets the caller
+# place the cursor explicitly, and batches everything into a single `doupdate`
+# per frame. Header redraws can be throttled to a maximum frame rate (see
+# `header_frame_due`), so fast typists don't flood slow terminals.
+class Renderer:
+
+    DEFAULT_HEADER_FPS = 15
+
+    def __init__(self, win, header_fps=DEFAULT_HEADER_FPS):
+        self.win = win
+        self.header_frame_interval = 1 / header_fps if header_fps > 0 else 0
+        self.last_header_frame_time = None
+
+        # What's currently drawn on each cell, as {(y, x): (char, attr)}
+        self.cells = {}
+        self.cursor = None
+
+        curses.init_pair(1, curses.COLOR_BLUE, curses.COLOR_BLACK)
+        self.header_colors = curses.color_pair(1)
+
+
+    def clear(self):
+        self.win.clear()
+        self.cells.clear()
+        self.cursor = None
+        self.last_header_frame_time = None
+
+
+    def put(self, y, x, text, attr=0):
+        # Only write the runs of characters that actually differ from what's
+        # already on screen
+        run_start = None
+        for i, char in enumerate(text):
+            cell = (y, x + i)
+            if self.cells.get(cell) == (char, attr):
+                if run_start is not None:
+                    self.win.addstr(y, x + run_start, text[run_start:i], attr)
+                    run_start = None
+                continue
+            self.cells[cell] = (char, attr)
+            if run_start is None:
+                run_start = i
+        if run_start is not None:
+            self.win.addstr(y, x + run_start, text[run_start:], attr)
+
+
+    def move(self, y, x):
+        self.cursor = (y, x)
+
+
+    def header_frame_due(self, force=False):
+        now = time.monotonic()
+        if not force and self.last_header_frame_time is not None \
+                and now - self.last_header_frame_time < self.header_frame_interval:
+            return False
+        self.last_header_frame_time = now
+        return True
+
+
+    def flush(self):
+        with span('flush'):
+            if self.cursor is not None:
+                self.win.move(*self.cursor)
+            self.win.noutrefresh()
+            curses.doupdate()
@@ -0,0 +1,115 @@
+from array import array
+import time
+
+
+# Live metrics over the last few seconds of typing: WPM over several windows,
+# the peak burst speed and how accuracy is trending.
+#
+# Keystrokes are counted in one bucket per second, in ring buffers as long as
+# the longest window, so registering one is O(1) and reading the metrics costs
+# the same however long the session. Buckets are tagged with the second they
+# hold, so the ones left from earlier laps of the ring read as empty.
+#
+# Metrics carry on across paragraphs. Time between them (reading the results,
+# waiting for the next one...) doesn't count: the clock is paused at the end of
+# each paragraph, and resumed with the next keystroke.
+class RollingMetrics:
+
+    WINDOWS_S = (5, 15, 60)
+
+    # Peak speed is the best WPM over this window, once typing for that long
+    BURST_WINDOW_S = 5
+
+    # Recent accuracy is compared to the one over the longest window
+    TREND_WINDOW_S = 15
+
+    # Smaller accuracy changes (in points) don't count as a trend
+    TREND_THRESHOLD = 1
+
+
+    def __init__(self):
+        self.size = max(self.WINDOWS_S)
+        self.bucket_seconds = array('q', [-1] * self.size)
+        self.char_counts = array('L', [0] * self.size)
+        self.error_counts = array('L', [0] * self.size)
+
+        self.paused_s = 0
+        self.paused_at = None
+        self.first_keystroke_time = None
+        self.peak_burst_wpm = 0
+
+
+    def register_char(self, is_wrong, now=None):
+        now = self._clock(now if now is not None else time.time(), resume=True)
+        if self.first_keystroke_time is None:
+            self.first_keystroke_time = now
+
+        second = int(now)
+        slot = second % self.size
+        if self.bucket_seconds[slot] != second:
+            self.bucket_seconds[slot] = second
+            self.char_counts[slot] = 0
+            self.error_counts[slot] = 0
+        self.char_counts[slot] += 1
+        self.error_counts[slot] += is_wrong
+
+        if now - self.first_keystroke_time >= self.BURST_WINDOW_S:
+            self.peak_burst_wpm = max(self.peak_burst_wpm, self._wpm(now, self.BURST_WINDOW_S))
+
+
+    def pause(self, now=None):
+        if self.paused_at is None:
+            self.paused_at = now if now is not None else time.time()
+
+
+    def stats(self, now=None):
+        now = self._clock(now if now is not None else time.time())
+        stats = {f'wpm_{window_s}s': self._wpm(now, window_s) for window_s in self.WINDOWS_S}
+        stats['peak_burst_wpm'] = self.peak_burst_wpm
+
+        recent_accuracy = self._accuracy(now, self.TREND_WINDOW_S)
+        overall_accuracy = self._accuracy(now, self.size)
+        stats[f'accuracy_{self.TREND_WINDOW_S}s'] = recent_accuracy
+        if recent_accuracy is None or overall_accuracy is None or abs(recent_accuracy - overall_accuracy) < self.TREND_THRESHOLD:
+            stats['accuracy_trend'] = 0
+        else:
+            stats['accuracy_trend'] = 1 if recent_accuracy > overall_accuracy else -1
+        return stats
+
+
+    # Time with the pauses taken out. Resumes the clock if paused, when asked
+    def _clock(self, now, resume=False):
+        if self.paused_at is not None:
+            if not resume:
+                return self.paused_at - self.paused_s
+            self.paused_s += now - self.paused_at
+            self.paused_at = None
+        return now - self.paused_s
+
+
+    # Char and error counts over the window ending now, and the time it spans
+    # (less than the window if typing started within it)
+    def _window(self, now, window_s):
+        if self.first_keystroke_time is None:
+            return 0, 0, 0
+
+        second = int(now)
+        chars = errors = 0
+        for bucket_second in range(second - window_s + 1, second + 1):
+            slot = bucket_second % self.size
+            if self.bucket_seconds[slot] == bucket_second:
+                chars += self.char_counts[slot]
+                errors += self.error_counts[slot]
+        return chars, errors, now - max(second - window_s + 1, self.first_keystroke_time)
+
+
+    # Spans under a second are taken as one, as a couple of keys typed in a
+    # flash don't tell the speed
+    def _wpm(self, now, window_s):
+        chars, _, span_s = self._window(now, window_s)
+        return chars / 5 / (max(span_s, 1) / 60)
+
+
+    def _accuracy(self, now, window_s):
+        chars, errors, _ = self._window(now, window_s)
+        return (chars - errors) * 100 / chars if chars > 0 else None
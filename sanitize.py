@@ -0,0 +1,37 @@
+import unicodedata
+
+
+# Bump when changing what `sanitize_text` does, so text sanitized ahead of
+# time (see `paragraph_cache`) is sanitized again
+SANITIZER_VERSION = 1
+
+# Replacements for characters that are not easily typeable
+SANITIZE_TRANSLATION = str.maketrans("–‘’“”", "-''\"\"")
+
+
+# Text already sanitized (e.g. read from the paragraph cache), which
+# `sanitize_text` returns as is. Stripping it keeps it marked as such
+class SanitizedText(str):
+
+    def strip(self, chars=None):
+        return SanitizedText(super().strip(chars))
+
+
+def sanitize_text(user_text):
+    # Nothing to normalize or replace in plain ASCII text, or text that's been
+    # sanitized already
+    if isinstance(user_text, SanitizedText) or user_text.isascii():
+        return user_text
+
+    # Unicode combining characters take space on the string, but not on the
+    # screen, messing up UI calculations. The line is then normalized to NFKC.
+    # This way we have no combining characters, and have the resulting combined
+    # characters be the canonical equivalent form, most probably the one the
+    # keyboard/terminal/OS will deliver (untested assumption but makes sense :p).
+    # EDIT: Already used the app with different text pulled from different
+    # places of the internet and has not given any problems so far :)
+    normalized_text = unicodedata.normalize('NFKC', user_text)
+
+    # Replace characters that are not easily typeable
+    # TODO: Make this an option? There are weird ways to type these...
+    return normalized_text.translate(SANITIZE_TRANSLATION).replace("…", "...")
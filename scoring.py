@@ -0,0 +1,242 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+from keylog import KeystrokeLog, typed_paragraphs
+from paragraph_state import ParagraphState
+from parallel import batches, map_batches
+from stats_text import render_aggregate_stats_as_list
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Offline scoring of recorded typing sessions, in bulk, with the same stats the
+# app shows after each paragraph (see `ParagraphState.stats`).
+#
+# A session is an id, the expected text, the keys as typed (a string, with
+# '\b' or '\x7f' for backspaces) and the time of each key. Keys are scored as
+# the exercise would have taken them: backspaces at the start do nothing, and
+# keys after the one finishing the text are ignored. Sessions that weren't
+# finished are timed up to their last key.
+#
+# Sessions go in batches to a pool of worker processes, and their stats come
+# back in order, to be streamed out as CSV or JSON lines. With NumPy, each
+# batch is scored at once over the keys of all its sessions.
+#
+#   python scoring.py sessions.jsonl -o scores.csv
+#   python scoring.py --history -o scores.jsonl --summary
+#
+# Paragraphs from the history are identified by the time they started (see
+# `keylog.typed_paragraphs`).
+
+BACKSPACES = ('\b', '\x7f')
+
+# Sessions are sent to the worker processes in batches this big
+BATCH_SIZE = 1_000
+
+STATS_FIELDS = tuple(ParagraphState.stats_from_counts(1, 0, 0, 0, 0))
+
+
+# Yields the (id, stats) of each session, in order. Runs in this process if
+# `workers` is 1, and on a pool of that many processes (one per CPU by
+# default) otherwise
+def score_sessions(sessions, workers=None):
+    workers = workers or os.cpu_count() or 1
+    for batch, batch_stats in map_batches(_score_sessions_batch, batches(sessions, BATCH_SIZE), workers):
+        yield from zip((session_id for session_id, *_ in batch), batch_stats)
+
+
+# Stats of each of the (text, keys, times) sessions
+def score_batch(sessions):
+    for text, keys, times in sessions:
+        if not text:
+            raise ValueError('Sessions need some text to type')
+        if len(keys) != len(times):
+            raise ValueError(f'Sessions need a time for each key ({len(keys)} keys, {len(times)} times)')
+
+    if numpy is not None:
+        counts = _counts_numpy(sessions)
+    else:
+        counts = [_counts_python(*session) for session in sessions]
+
+    return [
+        ParagraphState.stats_from_counts(len(text), chars_touched, error_count, uncorrected_error_count, end_time - start_time if start_time else 0)
+        for (text, _, _), (chars_touched, error_count, uncorrected_error_count, start_time, end_time) in zip(sessions, counts)
+    ]
+
+
+# Sessions in a JSON lines file: one object per line, with the `text`, `keys`
+# and `times` of the session, and optionally an `id` (the line number
+# otherwise)
+def read_jsonl_sessions(f):
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            session = json.loads(line)
+            yield session.get('id', line_number), session['text'], session['keys'], session['times']
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f'Invalid session on line {line_number}: {e}') from e
+
+
+def write_csv(results, f):
+    writer = csv.writer(f)
+    writer.writerow(('id',) + STATS_FIELDS)
+    for session_id, stats in results:
+        writer.writerow([session_id] + [stats[field] for field in STATS_FIELDS])
+        yield stats
+
+
+def write_jsonl(results, f):
+    for session_id, stats in results:
+        f.write(json.dumps(dict(id=session_id, **stats)) + '\n')
+        yield stats
+
+
+# Same walk as `ParagraphState`, over one session. Returns the chars touched,
+# the error count, the uncorrected error count, and the start and end times
+def _counts_python(text, keys, times):
+    length = len(text)
+    wrong = bytearray(length)
+    cursor = chars_touched = error_count = uncorrected_error_count = 0
+    start_time = end_time = None
+
+    for key, time in zip(keys, times):
+        end_time = time
+        if key in BACKSPACES:
+            cursor = max(0, cursor - 1)
+            continue
+
+        if start_time is None:
+            start_time = time
+
+        # Only whether the char ends up wrong matters to the stats: amended
+        # chars count as correct
+        is_wrong = key != text[cursor]
+        error_count += is_wrong
+        uncorrected_error_count += is_wrong - wrong[cursor]
+        wrong[cursor] = is_wrong
+        cursor += 1
+        chars_touched = max(chars_touched, cursor)
+        if cursor == length:
+            break
+
+    return chars_touched, error_count, uncorrected_error_count, start_time, end_time
+
+
+# Same as `_counts_python`, for all the sessions at once: their keys are laid
+# end to end, and every step is done over all of them
+def _counts_numpy(sessions):
+    key_counts = numpy.array([len(keys) for _, keys, _ in sessions], dtype=numpy.int64)
+    text_lengths = numpy.array([len(text) for text, _, _ in sessions], dtype=numpy.int64)
+    key_starts = numpy.concatenate(([0], numpy.cumsum(key_counts)[:-1]))
+    text_starts = numpy.concatenate(([0], numpy.cumsum(text_lengths)[:-1]))
+    session_of_key = numpy.repeat(numpy.arange(len(sessions)), key_counts)
+
+    typed = numpy.frombuffer(''.join(keys for _, keys, _ in sessions).encode('utf-32-le'), dtype=numpy.uint32)
+    expected = numpy.frombuffer(''.join(text for text, _, _ in sessions).encode('utf-32-le'), dtype=numpy.uint32)
+    times = numpy.fromiter((time for _, _, session_times in sessions for time in session_times), dtype=numpy.float64, count=len(typed))
+    is_char = (typed != ord('\b')) & (typed != ord('\x7f'))
+
+    # The cursor is a walk of +1 per char and -1 per backspace, held at 0 (as
+    # backspaces there do nothing): the walk minus its lowest point so far, if
+    # below 0. Each session's walk is shifted below all the previous ones, so
+    # a single running minimum works for all of them
+    steps = numpy.where(is_char, 1, -1)
+    walk = numpy.concatenate(([0], numpy.cumsum(steps)))
+    walk = walk[1:] - numpy.repeat(walk[key_starts], key_counts)
+    key_totals = numpy.cumsum(key_counts)
+    shifts = numpy.repeat(key_totals + key_totals - key_counts, key_counts)
+    lowest = numpy.minimum.accumulate(walk - shifts) + shifts if len(walk) else walk
+    cursor = walk - numpy.minimum(lowest, 0)
+
+    # Keys after the one finishing the text are ignored
+    key_idx = numpy.arange(len(typed))
+    finishing = numpy.flatnonzero(is_char & (cursor == text_lengths[session_of_key]))
+    finished_sessions, first_finishing = numpy.unique(session_of_key[finishing], return_index=True)
+    last_key = key_starts + key_counts - 1
+    last_key[finished_sessions] = finishing[first_finishing]
+    scored = key_idx <= last_key[session_of_key]
+
+    chars = numpy.flatnonzero(scored & is_char)
+    session_of_char = session_of_key[chars]
+    char_idx = text_starts[session_of_char] + cursor[chars] - 1
+    is_wrong = typed[chars] != expected[char_idx]
+    chars_touched = numpy.zeros(len(sessions), dtype=numpy.int64)
+    numpy.maximum.at(chars_touched, session_of_char, cursor[chars])
+    error_count = numpy.bincount(session_of_char[is_wrong], minlength=len(sessions))
+
+    # Chars end up in the state of the last key typed on them
+    last_typed = numpy.full(len(expected), -1, dtype=numpy.int64)
+    numpy.maximum.at(last_typed, char_idx, numpy.arange(len(chars)))
+    last_typed = last_typed[last_typed >= 0]
+    uncorrected_error_count = numpy.bincount(session_of_char[last_typed[is_wrong[last_typed]]], minlength=len(sessions))
+
+    started_sessions, first_char = numpy.unique(session_of_char, return_index=True)
+    start_times = [None] * len(sessions)
+    for session, time in zip(started_sessions.tolist(), times[chars[first_char]].tolist()):
+        start_times[session] = time
+    end_times = [times[key].item() if count else None for key, count in zip(last_key.tolist(), key_counts.tolist())]
+
+    return list(zip(chars_touched.tolist(), error_count.tolist(), uncorrected_error_count.tolist(), start_times, end_times))
+
+
+# Stats of a batch of (id, text, keys, times) sessions
+def _score_sessions_batch(batch):
+    return score_batch([session for _, *session in batch])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='typetrain-scoring', description='Score recorded typing sessions, as the TypeTrain would')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('input', nargs='?', help='JSON lines file with the sessions ("-" for stdin): one {"id", "text", "keys", "times"} object per line')
+    source.add_argument('--history', action='store_true', help='score the paragraphs in the keystroke history instead')
+    parser.add_argument('-o', '--output', default='-', help='where to write the scores ("-" for stdout, the default). As CSV, unless it ends with .jsonl')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='output format, if not the one implied by the output file name')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--summary', action='store_true', help='print the aggregate stats of all the sessions at the end, to stderr')
+    args = parser.parse_args()
+
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'csv')
+    write = write_jsonl if output_format == 'jsonl' else write_csv
+
+    # Sessions are streamed from the source while scored, so it's kept open
+    # until the end. The history is only read, so it can be scored while the
+    # app is running
+    if args.history:
+        try:
+            source = KeystrokeLog(read_only=True)
+        except FileNotFoundError:
+            exit('No keystroke history to score')
+        sessions = typed_paragraphs(source.records())
+    elif args.input == '-':
+        source = sys.stdin
+        sessions = read_jsonl_sessions(source)
+    else:
+        if not os.path.exists(args.input):
+            exit(f'File {args.input} does not exist')
+        source = open(args.input, 'r')
+        sessions = read_jsonl_sessions(source)
+
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w', newline='' if output_format == 'csv' else None)
+    try:
+        aggregate_stats = ParagraphState.aggregate_multiple_stats(write(score_sessions(sessions, args.workers), output_file))
+    except ValueError as e:
+        exit(f'Could not score the sessions: {e}')
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+        if source is not sys.stdin:
+            source.close()
+
+    if args.summary:
+        print(render_aggregate_stats_as_list(aggregate_stats), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
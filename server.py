@@ -0,0 +1,155 @@
+import asyncio
+import os
+
+from paragraph_state import ParagraphState
+from plugins import async_paragraphs_with_checkpoints, is_valid_checkpoint, paragraphs_with_checkpoints
+from protocol import encode_message, parse_address, read_message, start_server
+from sanitize import sanitize_text
+
+
+# Hosts typing sessions for remote clients (see client.py and protocol.py), so
+# a whole room can train from a single process.
+#
+# All sessions share the plugin instance, and so whatever it loaded or mapped
+# (corpora, caches, indexes...). Each one has its own generator over the
+# plugin's paragraphs, and the state of the paragraph being typed. Everything
+# runs on one event loop; only pulling paragraphs from sync plugins runs on
+# worker threads, one step at a time, as that can block on I/O.
+class TrainingServer:
+
+    # How often the stats are sent to a client while its paragraph is in
+    # progress, so they keep up with the time passing
+    LIVE_STATS_INTERVAL_S = 0.25
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+
+    async def serve_forever(self, address):
+        server = await start_server(self._handle_connection, address)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            kind, location = parse_address(address)
+            if kind == 'unix' and os.path.exists(location):
+                os.remove(location)
+
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            await self._run_session(reader, writer)
+        except (ConnectionError, ValueError) as e:
+            if not writer.is_closing():
+                writer.write(encode_message('error', message=str(e)))
+        except OSError as e:
+            # Failing to read the plugin's source (or to cache it)
+            if not writer.is_closing():
+                writer.write(encode_message('error', message=f'Could not read the paragraphs: {e}'))
+        except asyncio.CancelledError:
+            # Server shutting down
+            pass
+        finally:
+            writer.close()
+
+
+    async def _run_session(self, reader, writer):
+        writer.write(encode_message(
+            'welcome',
+            plugin=self.plugin.one_word_name,
+            resume_key=getattr(self.plugin, 'resume_key', None),
+        ))
+        hello = await read_message(reader)
+        if hello is None:
+            return
+        if hello.get('type') != 'hello':
+            raise ValueError('Expected a hello message')
+        if not is_valid_checkpoint(self.plugin, hello.get('checkpoint')):
+            raise ValueError(f'Invalid checkpoint: {hello.get("checkpoint")!r}')
+
+        paragraphs = self._paragraphs(hello.get('checkpoint'))
+        try:
+            async for paragraph, checkpoint in paragraphs:
+                writer.write(encode_message('paragraph', text=paragraph, checkpoint=checkpoint))
+                if not await self._run_paragraph(paragraph, reader, writer):
+                    return
+                if not await self._wait_for_next(reader):
+                    return
+        finally:
+            await paragraphs.aclose()
+        writer.write(encode_message('end'))
+        await writer.drain()
+
+
+    # Handles the keys of the client until the paragraph is done. Returns
+    # False if the client went away before
+    async def _run_paragraph(self, paragraph, reader, writer):
+        state = ParagraphState(paragraph)
+        ticker = asyncio.get_running_loop().create_task(self._tick_stats(state, writer))
+        try:
+            while not state.is_exercise_done():
+                message = await read_message(reader)
+                if message is None:
+                    return False
+                if message.get('type') != 'key':
+                    raise ValueError('Expected a key message')
+
+                key = message.get('key')
+                if key in ('\x7f', '\x08'):
+                    try:
+                        state.register_backspace()
+                    except ParagraphState.AlreadyAtBeggining:
+                        continue
+                    writer.write(encode_message('backspace', idx=state.current_char_idx))
+                elif type(key) == str and len(key) == 1 and (key.isprintable() or key == '\n'):
+                    idx = state.current_char_idx
+                    writer.write(encode_message('char', idx=idx, state=state.register_char(key)))
+
+                # Only wait for the client to take the echoes if it's falling
+                # behind (otherwise, this returns right away)
+                await writer.drain()
+        finally:
+            ticker.cancel()
+
+        writer.write(encode_message('done', stats=state.stats()))
+        await writer.drain()
+        return True
+
+
+    # Waits for the client to ask for the next paragraph. Keys typed in the
+    # meantime (right after the one finishing the paragraph, say) were in
+    # flight before the client knew it was done, so they're dropped. Returns
+    # False if the client went away before
+    async def _wait_for_next(self, reader):
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                return False
+            if message.get('type') == 'next':
+                return True
+            if message.get('type') != 'key':
+                raise ValueError('Expected a next message')
+
+
+    async def _tick_stats(self, state, writer):
+        while True:
+            await asyncio.sleep(self.LIVE_STATS_INTERVAL_S)
+            if state.start_time is not None:
+                writer.write(encode_message('stats', stats=state.stats()))
+
+
+    # Sanitized, non-empty paragraphs of the plugin, along with their
+    # checkpoints, from the given checkpoint on
+    async def _paragraphs(self, checkpoint):
+        if hasattr(self.plugin, 'async_paragraph_generator'):
+            source = async_paragraphs_with_checkpoints(self.plugin, checkpoint)
+            async for paragraph, paragraph_checkpoint in source:
+                if paragraph := sanitize_text(paragraph.strip()):
+                    yield paragraph, paragraph_checkpoint
+            return
+
+        source = paragraphs_with_checkpoints(self.plugin, checkpoint)
+        while item := await asyncio.to_thread(next, source, None):
+            paragraph, paragraph_checkpoint = item
+            if paragraph := sanitize_text(paragraph.strip()):
+                yield paragraph, paragraph_checkpoint
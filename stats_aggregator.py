@@ -0,0 +1,218 @@
+import datetime
+import json
+import os
+
+from storage import atomic_write, locked, storage_path
+
+
+# Aggregate stats of any number of paragraphs, built up one paragraph at a time
+# in constant memory, with the medians and 90th percentiles of their WPM and
+# accuracy, and their streaks of correct paragraphs.
+#
+# Aggregates can be merged (those of a later run into those of an earlier one)
+# and saved as JSON, so the ones of separate sessions or processes add up
+# cheaply. That's how the daily rollups in the history are kept.
+#
+# Percentiles come from histograms with fixed bins, interpolated within them,
+# so they're off by less than a bin's width (and kept within the lowest and
+# highest values seen). Paragraphs faster than the last WPM bin count as in it.
+class StatsAggregator:
+
+    VERSION = 1
+
+    WPM_BIN_WIDTH = 1
+    WPM_BINS = 300
+    ACCURACY_BIN_WIDTH = 0.5
+    ACCURACY_BINS = 201
+
+    TOTALS = ('total_paragraphs', 'correct_paragraphs', 'total_length_txt', 'time_s', 'error_count', 'uncorrected_error_count')
+
+
+    def __init__(self):
+        self.totals = dict.fromkeys(self.TOTALS, 0)
+        self.wpm_histogram = [0] * self.WPM_BINS
+        self.accuracy_histogram = [0] * self.ACCURACY_BINS
+        self.wpm_range = None
+        self.accuracy_range = None
+
+        # Correct paragraphs in a row: from the first one, up to the last one
+        # (the current streak), and the longest anywhere. The first two are
+        # what's needed to join the streaks of merged aggregates
+        self.first_streak = 0
+        self.last_streak = 0
+        self.longest_streak = 0
+
+
+    def add(self, stats):
+        totals = self.totals
+        totals['total_paragraphs'] += 1
+        totals['correct_paragraphs'] += stats['all_correct']
+        totals['total_length_txt'] += stats['length_txt']
+        totals['time_s'] += stats['time_s']
+        totals['error_count'] += stats['error_count']
+        totals['uncorrected_error_count'] += stats['uncorrected_error_count']
+
+        self.wpm_histogram[self._bin(stats['net_wpm'], self.WPM_BIN_WIDTH, self.WPM_BINS)] += 1
+        self.accuracy_histogram[self._bin(stats['result_accuracy'], self.ACCURACY_BIN_WIDTH, self.ACCURACY_BINS)] += 1
+        self.wpm_range = self._widen(self.wpm_range, [stats['net_wpm'], stats['net_wpm']])
+        self.accuracy_range = self._widen(self.accuracy_range, [stats['result_accuracy'], stats['result_accuracy']])
+
+        if stats['all_correct']:
+            if self.first_streak == totals['total_paragraphs'] - 1:
+                self.first_streak += 1
+            self.last_streak += 1
+            self.longest_streak = max(self.longest_streak, self.last_streak)
+        else:
+            self.last_streak = 0
+
+
+    # Adds the paragraphs of the other aggregate, as if they came after these
+    def merge(self, other):
+        self.longest_streak = max(self.longest_streak, other.longest_streak, self.last_streak + other.first_streak)
+        if self.first_streak == self.totals['total_paragraphs']:
+            self.first_streak += other.first_streak
+        if other.last_streak == other.totals['total_paragraphs']:
+            self.last_streak += other.last_streak
+        else:
+            self.last_streak = other.last_streak
+
+        for total in self.TOTALS:
+            self.totals[total] += other.totals[total]
+        self.wpm_histogram = [a + b for a, b in zip(self.wpm_histogram, other.wpm_histogram)]
+        self.accuracy_histogram = [a + b for a, b in zip(self.accuracy_histogram, other.accuracy_histogram)]
+        self.wpm_range = self._widen(self.wpm_range, other.wpm_range)
+        self.accuracy_range = self._widen(self.accuracy_range, other.accuracy_range)
+        return self
+
+
+    # Formulas from https://www.speedtypingonline.com/typing-equations
+    def stats(self):
+        totals = self.totals
+        total_paragraphs = totals['total_paragraphs']
+        total_length_txt = totals['total_length_txt']
+        total_length_std_words = total_length_txt / 5
+        time_m = totals['time_s'] / 60
+
+        # HACK: 0.2 is the word-length of a character. This fixes the issue of a single character being counted as infinite WPM
+        gross_wpm = (total_length_std_words - 0.2) / time_m if time_m > 0 else 0
+
+        return {
+            'total_paragraphs': total_paragraphs,
+            'correct_paragraphs': totals['correct_paragraphs'],
+            'correct_paragraphs_pct': totals['correct_paragraphs'] * 100 / total_paragraphs if total_paragraphs > 0 else 0,
+            'total_length_txt': total_length_txt,
+            'total_length_std_words': total_length_std_words,
+            'time_s': totals['time_s'],
+            'time_m': time_m,
+            'error_count': totals['error_count'],
+            'uncorrected_error_count': totals['uncorrected_error_count'],
+            'gross_wpm': gross_wpm,
+            # Net WPM could be negative since an error is penalized as one whole wrong word. Constrained since it wouldn't make much sense
+            'net_wpm': max(0, gross_wpm - (totals['uncorrected_error_count'] / time_m)) if time_m > 0 else 0,
+            'result_accuracy': (total_length_txt - totals['uncorrected_error_count']) * 100 / total_length_txt if total_length_txt > 0 else 0,
+            # Real accuracy could be negative if there are many errors on the same characters. Constrained since it wouldn't make much sense
+            'real_accuracy': max(0, (total_length_txt - totals['error_count']) * 100 / total_length_txt) if total_length_txt > 0 else 0,
+            'median_wpm': self._percentile(self.wpm_histogram, self.WPM_BIN_WIDTH, self.wpm_range, 0.5),
+            'p90_wpm': self._percentile(self.wpm_histogram, self.WPM_BIN_WIDTH, self.wpm_range, 0.9),
+            'median_accuracy': self._percentile(self.accuracy_histogram, self.ACCURACY_BIN_WIDTH, self.accuracy_range, 0.5),
+            'p90_accuracy': self._percentile(self.accuracy_histogram, self.ACCURACY_BIN_WIDTH, self.accuracy_range, 0.9),
+            'current_streak': self.last_streak,
+            'longest_streak': self.longest_streak,
+        }
+
+
+    def to_dict(self):
+        return {
+            'version': self.VERSION,
+            'totals': self.totals,
+            'wpm_histogram': self.wpm_histogram,
+            'accuracy_histogram': self.accuracy_histogram,
+            'wpm_range': self.wpm_range,
+            'accuracy_range': self.accuracy_range,
+            'streaks': [self.first_streak, self.last_streak, self.longest_streak],
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != cls.VERSION:
+            raise ValueError(f'Unsupported aggregate version: {data.get("version")}')
+        aggregator = cls()
+        aggregator.totals.update(data['totals'])
+        aggregator.wpm_histogram = list(data['wpm_histogram'])
+        aggregator.accuracy_histogram = list(data['accuracy_histogram'])
+        aggregator.wpm_range = data['wpm_range']
+        aggregator.accuracy_range = data['accuracy_range']
+        aggregator.first_streak, aggregator.last_streak, aggregator.longest_streak = data['streaks']
+        return aggregator
+
+
+    @staticmethod
+    def _bin(value, bin_width, bins):
+        return min(bins - 1, max(0, int(value / bin_width)))
+
+
+    # [lowest, highest] of both ranges (either can be None, for no values)
+    @staticmethod
+    def _widen(value_range, other_range):
+        if value_range is None or other_range is None:
+            return other_range or value_range
+        return [min(value_range[0], other_range[0]), max(value_range[1], other_range[1])]
+
+
+    # Value below which the given fraction of the paragraphs are, interpolated
+    # within its bin (except for the last one, which is open-ended)
+    @staticmethod
+    def _percentile(histogram, bin_width, value_range, fraction):
+        rank = fraction * sum(histogram)
+        if rank == 0:
+            return 0
+
+        count_below = 0
+        for idx, count in enumerate(histogram):
+            if count and count_below + count >= rank:
+                if idx == len(histogram) - 1:
+                    value = idx * bin_width
+                else:
+                    value = (idx + (rank - count_below) / count) * bin_width
+                return min(max(value, value_range[0]), value_range[1])
+            count_below += count
+        return 0
+
+
+# Aggregate stats of each day, in the history. Sessions are merged into the one
+# of the day they ended, so a whole week can be summed up from just 7 of them
+DAILY_ROLLUPS_DIR = os.path.join('history', 'daily')
+
+
+def daily_rollup_path(day):
+    return storage_path(DAILY_ROLLUPS_DIR, f'{day.isoformat()}.json')
+
+
+def load_daily_rollup(day):
+    try:
+        with open(daily_rollup_path(day), 'r') as f:
+            return StatsAggregator.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return StatsAggregator()
+
+
+# Locked from loading to writing, so sessions ending at once are all added
+def add_to_daily_rollup(aggregator, day=None):
+    day = day or datetime.date.today()
+    path = daily_rollup_path(day)
+    with locked(path):
+        rollup = load_daily_rollup(day).merge(aggregator)
+
+        # Written atomically, so an interrupted write doesn't lose the day
+        with atomic_write(path) as f:
+            json.dump(rollup.to_dict(), f)
+
+
+# Aggregate of the last days, up to the given one (today by default)
+def recent_rollup(days, until=None):
+    until = until or datetime.date.today()
+    rollup = StatsAggregator()
+    for days_before in reversed(range(days)):
+        rollup.merge(load_daily_rollup(until - datetime.timedelta(days=days_before)))
+    return rollup
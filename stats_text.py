@@ -0,0 +1,38 @@
+# Stats as text, shown after each paragraph and at the end of a session (and
+# printed by the scoring tool)
+
+
+def render_stats_as_list(stats):
+    return (
+        f'WPM: {stats["net_wpm"]:.2f}, {stats["gross_wpm"]:.2f} gross\n'
+        f'Accuracy: {stats["result_accuracy"]:.2f}%, {stats["real_accuracy"]:.2f}% real\n'
+        f'Errors: {stats["error_count"]}, {stats["uncorrected_error_count"]} not corrected\n'
+        f'Excercise Length: {stats["length_txt"]} chars, {stats["length_std_words"]:.2f} "standard" words\n'
+        f'Time: {stats["time_s"]:.2f} s\n'
+    )
+
+
+def render_aggregate_stats_as_list(agg_stats):
+    return (
+        f'Average WPM: {agg_stats["net_wpm"]:.2f} ({agg_stats["gross_wpm"]:.2f} gross)\n'
+        f'Average accuracy: {agg_stats["result_accuracy"]:.2f}% ({agg_stats["real_accuracy"]:.2f}% real)\n'
+        f'Errors: {agg_stats["error_count"]} ({agg_stats["uncorrected_error_count"]} not corrected)\n'
+        f'Total exercises length: {agg_stats["total_length_txt"]} chars, {agg_stats["total_length_std_words"]:.2f} "standard" words\n'
+        f'Total paragraphs: {agg_stats["total_paragraphs"]}\n'
+        f'Correct paragraphs: {agg_stats["correct_paragraphs"]} ({agg_stats["correct_paragraphs_pct"]:.2f}%)\n'
+        f'Total typing time: {agg_stats["time_m"]:.2f} minutes\n'
+        f'Median WPM: {agg_stats["median_wpm"]:.0f} ({agg_stats["p90_wpm"]:.0f} at the 90th percentile)\n'
+        f'Median accuracy: {agg_stats["median_accuracy"]:.1f}% ({agg_stats["p90_accuracy"]:.1f}% at the 90th percentile)\n'
+        f'Longest streak of correct paragraphs: {agg_stats["longest_streak"]}\n'
+    )
+
+
+def render_slowest_bigrams(bigrams):
+    if not bigrams:
+        return ''
+    def visible(text):
+        return text.replace(' ', '␣').replace('\n', '↵')
+    return 'Slowest bigrams:\n' + ''.join(
+        f'  {visible(bigram)}  {row["mean_latency_s"] * 1000:.0f} ms ({row["error_rate"] * 100:.0f}% errors)\n'
+        for bigram, row in bigrams
+    )
@@ -0,0 +1,57 @@
+import contextlib
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Where TypeTrain keeps its own files (resume checkpoints, history, caches...).
+# Can be moved elsewhere with the TYPETRAIN_HOME environment variable
+TYPETRAIN_HOME = os.environ.get('TYPETRAIN_HOME', os.path.join(os.path.expanduser('~'), '.typetrain'))
+
+
+def storage_path(*parts):
+    path = os.path.join(TYPETRAIN_HOME, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# Opens a file to write in place of the one at `path`, which is only replaced
+# (at once) when the block ends without errors. Until then it's a temporary file
+# of its own, next to it, so neither an interrupted write nor concurrent ones
+# (from other threads or processes) can leave a broken file behind: the last
+# one to finish wins
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{name}.', suffix='.tmp', dir=directory or '.')
+    try:
+        with open(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+# Takes an exclusive lock on the open file, held until it's closed. Raises
+# BlockingIOError if it's held elsewhere (by another process, or another open
+# of the file), unless told to wait for it. Files aren't locked on platforms
+# without flock (Windows)
+def lock_file(f, wait=True):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+# Holds the lock of the file at `path` (on a `.lock` file next to it) during
+# the block, so read-modify-write cycles on it from several processes don't
+# lose each other's changes
+@contextlib.contextmanager
+def locked(path):
+    with open(f'{path}.lock', 'a') as f:
+        lock_file(f)
+        yield
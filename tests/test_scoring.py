@@ -0,0 +1,69 @@
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scoring
+from paragraph_state import ParagraphState
+
+
+# Bulk scoring must give the same stats as typing the same keys, at the same
+# times, through `ParagraphState` (as the app does)
+class ScoreBatchParityTest(unittest.TestCase):
+
+    SESSIONS = 500
+    ALPHABET = 'ab \n'
+
+
+    def setUp(self):
+        self.random = random.Random(1234)
+
+
+    def random_session(self):
+        text = ''.join(self.random.choices(self.ALPHABET, k=self.random.randint(1, 20)))
+        keys = ''.join(self.random.choices(self.ALPHABET + '\b\x7f', k=self.random.randint(0, 40)))
+        start = self.random.uniform(0, 1e9)
+        times = sorted(start + self.random.uniform(0, 60) for _ in keys)
+        return text, keys, times
+
+
+    # Stats of the session as the exercise would show them once it's over
+    # (or after its last key, if it wasn't finished)
+    def replay(self, text, keys, times):
+        state = ParagraphState(text)
+        now = 0
+        with mock.patch('time.time', lambda: now):
+            for key, now in zip(keys, times):
+                if key in scoring.BACKSPACES:
+                    try:
+                        state.register_backspace()
+                    except ParagraphState.AlreadyAtBeggining:
+                        pass
+                    continue
+                state.register_char(key)
+                if state.is_exercise_done():
+                    break
+            return state.stats()
+
+
+    def assert_parity(self):
+        sessions = [self.random_session() for _ in range(self.SESSIONS)]
+        for session, stats in zip(sessions, scoring.score_batch(sessions)):
+            self.assertEqual(stats, self.replay(*session), session)
+
+
+    def test_python(self):
+        with mock.patch.object(scoring, 'numpy', None):
+            self.assert_parity()
+
+
+    @unittest.skipIf(scoring.numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        self.assert_parity()
+
+
+if __name__ == '__main__':
+    unittest.main()
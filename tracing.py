@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+
+
+# Optional timing instrumentation for the hot paths, exported in the Chrome
+# trace event format (load the file in https://ui.perfetto.dev or
+# chrome://tracing).
+#
+# Code to measure goes in a `with span('name'):` block. Tracing is off by
+# default, and then `span` returns a shared no-op context manager, so the
+# instrumentation costs a function call and a couple of attribute lookups.
+# Spans can be opened from any thread, each one shows up on its own track.
+
+# Events recorded since `start_tracing()`, as (name, start_ns, duration_ns,
+# thread_id) tuples. None while tracing is off
+_events = None
+_thread_names = {}
+
+
+class _Span:
+    __slots__ = ('name', 'events', 'start_ns')
+
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+
+    def __exit__(self, *_):
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        thread_id = threading.get_ident()
+        if thread_id not in _thread_names:
+            _thread_names[thread_id] = threading.current_thread().name
+        self.events.append((self.name, self.start_ns, duration_ns, thread_id))
+        return False
+
+
+class _NoSpan:
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name):
+    if _events is None:
+        return NO_SPAN
+    return _Span(name, _events)
+
+
+def start_tracing():
+    global _events
+    if _events is None:
+        _events = []
+
+
+def stop_tracing():
+    global _events
+    _events = None
+
+
+# Yields the items of `iterable`, timing how long it takes to produce each one
+def traced(iterable, name):
+    iterator = iter(iterable)
+    while True:
+        with span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# Writes the events recorded so far as a trace event JSON file, with times in
+# microseconds
+def save_trace(path):
+    events = list(_events or ())
+    pid = os.getpid()
+    trace_events = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': thread_name}}
+        for thread_id, thread_name in _thread_names.items()
+    ]
+    trace_events += [
+        {'name': name, 'ph': 'X', 'ts': start_ns / 1000, 'dur': duration_ns / 1000, 'pid': pid, 'tid': thread_id}
+        for name, start_ns, duration_ns, thread_id in events
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)